@@ -1,45 +1,178 @@
+import importlib.util
+import os
+
 import numpy as np
 
 
-def knapsack_dp(w, v, C):
+def _load(name, *path):
+    """ Module loaded from the file at path, relative to the directory of this file. """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), *path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# The sparse (Pareto-list) solver is shared with dp/knapsack.py.
+_knapsack = _load('knapsack', '..', 'dp', 'knapsack.py')
+knapsack_sparse, SPARSE_COST = _knapsack.knapsack_sparse, _knapsack.SPARSE_COST
+
+
+def _ratio_order(w, v, C):
+    """ Items that fit, sorted by v/w in decreasing order. """
+    items = [i for i in range(len(w)) if w[i] <= C]
+    items.sort(key=lambda i: v[i] / w[i] if w[i] > 0 else np.inf, reverse=True)
+    return items
+
+
+def profit_bound(w, v, C):
     """
-    Dynamic programming solution to the knapsack problem.
-    :param w: list of weights
-    :param v: list of values
-    :param C: capacity
-    :return: maximum value, list of items (indices)
+    Dantzig upper bound on the value of the knapsack: fill greedily by v/w and
+    add the fractional part of the first item that does not fit (rounded down to an
+    integer, also for float weights or capacity).
     """
-    n = len(w)
-    m = sum(v)
-    # Initial conditions
-    f = np.full((n+1, m + 1), np.inf)
-    f[:, 0] = 0
-    f[1][v[0]] = w[0]
-    # Compute the table
-    for i in range(n + 1):
-        for s in range(m + 1):
-            if v[i - 1] <= s:
-                f[i][s] = min(f[i - 1][s], f[i - 1][s - v[i - 1]] + w[i - 1])
-            else:
-                f[i][s] = f[i - 1][s]
-
-    max_value = 0
-    for s in range(m, -1, -1):
-        if f[n][s] <= C:
-            max_value = s
+    bound, room = 0, C
+    for i in _ratio_order(w, v, C):
+        if w[i] > room:
+            return bound + int(v[i] * room // w[i])
+        bound += v[i]
+        room -= w[i]
+    return bound
+
+
+def reduce_items(w, v, C):
+    """
+    Variable reduction (Dembo-Hammer). Let b be the first item, in the order of v/w, that
+    does not fit and r = v[b]/w[b]. Moving item i away from its value in the LP relaxation
+    lowers the LP bound by at least |v[i] - r*w[i]|, so if that falls below the greedy value,
+    item i keeps its LP value in every optimal solution.
+    :return: items fixed in the knapsack, free items
+    """
+    items = _ratio_order(w, v, C)
+    upper, room = 0, C
+    for b, i in enumerate(items):
+        if w[i] > room:
             break
-    
-    # Construct the solution
+        upper += v[i]
+        room -= w[i]
+    else:
+        return items, []
+    # Lower bound: greedy, going on after the first item that does not fit.
+    lower, rest = upper, room
+    for i in items[b:]:
+        if w[i] <= rest:
+            lower += v[i]
+            rest -= w[i]
+    # Everything is multiplied by w[b] to stay in integers.
+    wb, vb = w[items[b]], v[items[b]]
+    upper = upper * wb + room * vb
+    fixed, free = [], []
+    for k, i in enumerate(items):
+        if upper - abs(v[i] * wb - vb * w[i]) < lower * wb:
+            if k < b:
+                fixed.append(i)
+        else:
+            free.append(i)
+    return fixed, free
+
+
+def _add_item(g, wi, vi, bound, C):
+    """
+    Adds an item to the row g, where g[p] is the minimum weight of a subset with value p
+    (C + 1, or inf for float weights, if there is none). The profit axis grows up to bound,
+    and the states that weigh more than C or are dominated (another state has a larger value
+    and no more weight) are trimmed.
+    :return: new row, decisions (taking the item at value vi + p, p = 0, 1, ...)
+    """
+    full = np.inf if g.dtype.kind == 'f' else C + 1
+    m = min(len(g) - 1 + vi, bound) + 1
+    if vi >= m or vi == 0:
+        return g, np.zeros(0, dtype=bool)
+    new = np.full(m, full, dtype=g.dtype)
+    new[:min(len(g), m)] = g[:m]
+    take = g[:m - vi] + wi
+    better = take < new[vi:]
+    np.minimum(new[vi:], take, out=new[vi:])
+    # A state is dominated if a state with a larger value weighs no more.
+    suffix_min = np.minimum.accumulate(new[::-1])[::-1]
+    new[:-1][new[:-1] >= suffix_min[1:]] = full
+    feasible = np.flatnonzero(new <= C)
+    return new[:feasible[-1] + 1], better
+
+
+def _profit_dp(w, v, C, max_bytes):
+    """ The profit-indexed DP of knapsack_dp, without the reduction. """
+    n = len(w)
+    bound = profit_bound(w, v, C)
+    integral = all(isinstance(x, (int, np.integer)) for x in w) and C < 2 ** 62
+    dtype = (np.int32 if C < 2 ** 30 else np.int64) if integral else np.float64
+    g = np.zeros(1, dtype=dtype)
+    block = max(1, n if n * (bound + 1) <= 8 * max_bytes else int(np.sqrt(n)))
+
+    def run(g, start, keep_bits):
+        bits = []
+        for i in range(start, min(start + block, n)):
+            g, better = _add_item(g, w[i], v[i], bound, C)
+            if keep_bits:
+                bits.append(np.packbits(better))
+        return g, bits
+
+    # Forward pass, keeping the row at the start of every block.
+    checkpoints = []
+    for start in range(0, n, block):
+        checkpoints.append(g)
+        g, bits = run(g, start, start + block >= n)
+    max_value = len(g) - 1
+
+    # Construct the solution, block by block from the last one.
     packed_items = []
-    for i in range(n, 0, -1):
-        if f[i][s] != f[i - 1][s]:
-            packed_items.append(i - 1)
-            s -= v[i - 1]
+    s = max_value
+    for start in reversed(range(0, n, block)):
+        if start + block < n:
+            _, bits = run(checkpoints[start // block], start, True)
+        for i in reversed(range(start, min(start + block, n))):
+            b, p = bits[i - start], s - v[i]
+            if 0 <= p < 8 * len(b) and (b[p >> 3] >> (7 - (p & 7))) & 1:
+                packed_items.append(i)
+                s = p
     packed_items.reverse()
-    
+
     return max_value, packed_items
 
 
+def knapsack_dp(w, v, C, max_bytes=1 << 28):
+    """
+    Dynamic programming solution to the knapsack problem, indexed by profit.
+    The items fixed by reduce_items are set aside; for the others, each row is a vector of
+    minimum weights per value. The decisions are kept as packed bits if they fit in max_bytes,
+    otherwise rows are checkpointed and the bits recomputed block by block.
+    The time is O(n * bound) with bound = profit_bound(w, v, C), i.e. the rows are as long as the
+    optimum value: e.g. 10^4 strongly correlated items (v = w + 100) rounded by knapsack_fptas
+    with eps = 0.01 have rows of about 5 * 10^5 values and take a minute or more.
+    If the Pareto front is expected to be much smaller than the rows (small capacity or
+    few items), knapsack_sparse is used instead.
+    :param w: list of weights
+    :param v: list of values (integers)
+    :param C: capacity
+    :param max_bytes: memory budget of the decision bits
+    :return: maximum value, list of items (indices)
+    """
+    fixed, free = reduce_items(w, v, C)
+    room = C - sum(w[i] for i in fixed)
+    w_free, v_free = [w[i] for i in free], [v[i] for i in free]
+    # The dense rows have up to bound+1 states, the Pareto front at most min(2^n, room+1, bound+1).
+    bound = profit_bound(w_free, v_free, room)
+    states = min(2 ** min(len(free), 64), bound + 1)
+    if all(isinstance(x, (int, np.integer)) for x in w_free + [room]):
+        states = min(states, room + 1)
+    if SPARSE_COST * states < bound + 1:
+        value, items = knapsack_sparse(w_free, v_free, room)
+    else:
+        value, items = _profit_dp(w_free, v_free, room, max_bytes)
+    packed_items = sorted(fixed + [free[i] for i in items])
+    return value + sum(v[i] for i in fixed), packed_items
+
+
 def knapsack_fptas(w, v, C, eps):
     """
     :param w: list of weights
@@ -47,10 +180,13 @@ def knapsack_fptas(w, v, C, eps):
     :param C: capacity
     :param eps: error tolerance
     :return: list of items (indices)
+    The rounded values sum to n / eps, so knapsack_dp takes O(n^2 / eps) time in the worst case.
     """
     # Step1: Round values 
     n = len(w)
     V = sum(v)
+    if V == 0:
+        return []
     K = eps * V / n
     v1 = [int(v[i] / K) for i in range(n)]
     # Step2: Solve knapsack w.r.t. v1
@@ -59,6 +195,29 @@ def knapsack_fptas(w, v, C, eps):
     return items
 
 
+def test_knapsack_dp():
+    from itertools import combinations
+    for _ in range(200):
+        n = np.random.randint(1, 10)
+        w = np.random.randint(1, 30, n).tolist()
+        v = np.random.randint(0, 40, n).tolist()
+        C = np.random.randint(0, 100)
+        best = max(sum(v[i] for i in s) for k in range(n + 1) for s in combinations(range(n), k)
+                   if sum(w[i] for i in s) <= C)
+        for max_bytes in (1 << 20, 1):
+            value, items = knapsack_dp(w, v, C, max_bytes)
+            assert value == best == sum(v[i] for i in items)
+            assert sum(w[i] for i in items) <= C
+        # Float weights and capacity.
+        wf, Cf = [x + 0.5 for x in w], C + 0.25
+        best = max(sum(v[i] for i in s) for k in range(n + 1) for s in combinations(range(n), k)
+                   if sum(wf[i] for i in s) <= Cf)
+        value, items = knapsack_dp(wf, v, Cf)
+        assert value == best == sum(v[i] for i in items) and sum(wf[i] for i in items) <= Cf
+        assert sum(w[i] for i in knapsack_fptas(w, v, float(C), 0.1)) <= C
+    print('[test_knapsack_dp] Passed.')
+
+
 def print_items(items, w, v):
     print('Item Indices:', items)
     print('Total weight:', sum([w[i] for i in items]))
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def newton_method(f, f1, x0, epsilon=1e-6, max_iter=1000):
     """
     Newton's method to find the root of a function.
@@ -34,6 +37,454 @@ def newton_method(f, f1, x0, epsilon=1e-6, max_iter=1000):
     raise ValueError("Newton's method did not converge")
 
 
+def _rows(args, index):
+    return [np.asarray(arg)[index] for arg in args]
+
+
+def newton_vec(f, f1, x0, args=(), epsilon=1e-6, max_iter=1000):
+    """
+    Newton's method on a vector of independent equations f(x[i], *args[i]) = 0.
+
+    Only the elements that have not converged are iterated: f and f1 are called on
+    the sub-vector of the active elements, with the matching rows of args.
+
+    Parameters
+    ----------
+    f : function
+        The vectorized function, called as f(x, *args).
+    f1 : function
+        The vectorized derivative of f, called as f1(x, *args).
+    x0 : array_like
+        The initial guesses.
+    args : tuple of array_like, optional
+        Per-element parameters of f and f1, aligned with x0.
+    epsilon : float, optional
+        The desired accuracy. The default is 1e-6.
+    max_iter : int, optional
+        The maximum number of iterations. The default is 1000.
+
+    Returns
+    -------
+    x : ndarray
+        The roots (the last iterate where failed).
+    iterations : ndarray
+        The number of iterations of every element.
+    failed : ndarray
+        True where the method did not converge or hit a zero derivative.
+    """
+    x = np.array(x0, dtype=float).ravel()
+    iterations = np.zeros(len(x), dtype=np.int64)
+    failed = np.zeros(len(x), dtype=bool)
+    active = np.arange(len(x))
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        xa, rows = x[active], _rows(args, active)
+        fx = f(xa, *rows)
+        # An exact root has converged, even where the derivative is zero too.
+        root = fx == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_new = np.where(root, xa, xa - fx / f1(xa, *rows))
+        iterations[active] += 1
+        bad = ~np.isfinite(x_new)
+        done = root | (np.abs(x_new - xa) < epsilon)
+        x[active] = np.where(bad, xa, x_new)
+        failed[active[bad]] = True
+        active = active[~(done | bad)]
+    failed[active] = True
+    return x, iterations, failed
+
+
+def _brackets(f, a, b, rows):
+    """ Values at the endpoints, and the elements without a sign change. """
+    a, b = np.array(a, dtype=float).ravel(), np.array(b, dtype=float).ravel()
+    fa, fb = f(a, *rows), f(b, *rows)
+    return a, b, fa, fb, (np.sign(fa) * np.sign(fb)) > 0
+
+
+def newton_bisect(f, f1, a, b, args=(), epsilon=1e-10, max_iter=200):
+    """
+    Safeguarded Newton's method on a vector of brackets [a[i], b[i]] with a sign change.
+
+    Every element keeps a bracket of its root; a Newton step that leaves the bracket or
+    does not halve the step of the iteration before is replaced by a bisection step.
+
+    Parameters
+    ----------
+    f : function
+        The vectorized function, called as f(x, *args).
+    f1 : function
+        The vectorized derivative of f, called as f1(x, *args).
+    a, b : array_like
+        The endpoints of the brackets.
+    args : tuple of array_like, optional
+        Per-element parameters of f and f1.
+    epsilon : float, optional
+        The desired accuracy. The default is 1e-10.
+    max_iter : int, optional
+        The maximum number of iterations. The default is 200.
+
+    Returns
+    -------
+    x : ndarray
+        The roots.
+    iterations : ndarray
+        The number of iterations of every element.
+    failed : ndarray
+        True where f has the same sign at both endpoints or the method did not converge.
+    """
+    a, b, fa, fb, failed = _brackets(f, a, b, _rows(args, slice(None)))
+    # Orient the brackets so that f(lo) < 0 < f(hi).
+    lo, hi = np.where(fa < 0, a, b), np.where(fa < 0, b, a)
+    x = np.where(fa == 0, a, np.where(fb == 0, b, (a + b) / 2))
+    dx_old = np.abs(b - a)
+    iterations = np.zeros(len(x), dtype=np.int64)
+    active = np.flatnonzero(~failed & (fa != 0) & (fb != 0))
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        xa, la, ha, rows = x[active], lo[active], hi[active], _rows(args, active)
+        fx, dfx = f(xa, *rows), f1(xa, *rows)
+        la, ha = np.where(fx < 0, xa, la), np.where(fx < 0, ha, xa)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = fx / dfx
+        newton = xa - step
+        bisect = (~np.isfinite(newton) | ((newton - la) * (newton - ha) >= 0)
+                  | (np.abs(2 * fx) > np.abs(dx_old[active] * dfx)))
+        x_new = np.where(bisect, (la + ha) / 2, newton)
+        iterations[active] += 1
+        dx_old[active] = np.abs(x_new - xa)
+        x[active], lo[active], hi[active] = x_new, la, ha
+        done = (fx == 0) | (np.abs(x_new - xa) < epsilon) | (np.abs(ha - la) < epsilon)
+        x[active[fx == 0]] = xa[fx == 0]
+        active = active[~done]
+    failed[active] = True
+    return x, iterations, failed
+
+
+def brent(f, a, b, args=(), epsilon=1e-12, max_iter=200):
+    """
+    Brent's method on a vector of brackets [a[i], b[i]] with a sign change: inverse
+    quadratic or secant interpolation, falling back to bisection when the interpolation
+    is too slow, every branch being taken per element with masks.
+
+    Parameters
+    ----------
+    f : function
+        The vectorized function, called as f(x, *args).
+    a, b : array_like
+        The endpoints of the brackets.
+    args : tuple of array_like, optional
+        Per-element parameters of f.
+    epsilon : float, optional
+        The desired accuracy. The default is 1e-12.
+    max_iter : int, optional
+        The maximum number of iterations. The default is 200.
+
+    Returns
+    -------
+    x : ndarray
+        The roots.
+    iterations : ndarray
+        The number of iterations of every element.
+    failed : ndarray
+        True where f has the same sign at both endpoints or the method did not converge.
+    """
+    a, b, fa, fb, failed = _brackets(f, a, b, _rows(args, slice(None)))
+    c, fc = b.copy(), fb.copy()
+    # d is the last step and e the one before it, compared with by the safeguard.
+    d = b - a
+    e = d.copy()
+    x = b.copy()
+    iterations = np.zeros(len(x), dtype=np.int64)
+    active = np.flatnonzero(~failed)
+    eps = np.finfo(float).eps
+    for _ in range(max_iter + 1):
+        if not len(active):
+            break
+        A, B, C, FA, FB, FC = a[active], b[active], c[active], fa[active], fb[active], fc[active]
+        D, E = d[active], e[active]
+        # Keep the root between B and C.
+        same = np.sign(FB) == np.sign(FC)
+        C, FC = np.where(same, A, C), np.where(same, FA, FC)
+        D, E = np.where(same, B - A, D), np.where(same, B - A, E)
+        # B is the best estimate.
+        swap = np.abs(FC) < np.abs(FB)
+        A, FA = np.where(swap, B, A), np.where(swap, FB, FA)
+        B, FB = np.where(swap, C, B), np.where(swap, FC, FB)
+        C, FC = np.where(swap, A, C), np.where(swap, FA, FC)
+        tol = 2 * eps * np.abs(B) + 0.5 * epsilon
+        xm = (C - B) / 2
+        done = (np.abs(xm) <= tol) | (FB == 0)
+        x[active] = B
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = FB / FA
+            q, r = FA / FC, FB / FC
+            secant = A == C
+            p = np.where(secant, 2 * xm * s, s * (2 * xm * q * (q - r) - (B - A) * (r - 1)))
+            q = np.where(secant, 1 - s, (q - 1) * (r - 1) * (s - 1))
+        q = np.where(p > 0, -q, q)
+        p = np.abs(p)
+        interpolate = ((np.abs(E) >= tol) & (np.abs(FA) > np.abs(FB))
+                       & (2 * p < np.minimum(3 * xm * q - np.abs(tol * q), np.abs(E * q))))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            E = np.where(interpolate, D, xm)
+            D = np.where(interpolate, p / q, xm)
+        A, FA = B, FB
+        B = B + np.where(np.abs(D) > tol, D, np.where(xm >= 0, tol, -tol))
+        keep = ~done
+        active, A, B, C, FA, FC, D, E = (v[keep] for v in (active, A, B, C, FA, FC, D, E))
+        if not len(active) or _ == max_iter:
+            break
+        FB = f(B, *_rows(args, active))
+        iterations[active] += 1
+        a[active], b[active], c[active], fa[active], fb[active], fc[active] = A, B, C, FA, FB, FC
+        d[active], e[active] = D, E
+    failed[active] = True
+    return x, iterations, failed
+
+
+def _factorize(J):
+    """ LU factorization of a dense array or a scipy.sparse matrix.
+    :return: solve(b, trans=False), solving J x = b (J^T x = b if trans)
+    """
+    import scipy.linalg
+    import scipy.sparse
+    import scipy.sparse.linalg
+    if scipy.sparse.issparse(J):
+        lu = scipy.sparse.linalg.splu(scipy.sparse.csc_matrix(J))
+        return lambda b, trans=False: lu.solve(b, 'T' if trans else 'N')
+    lu = scipy.linalg.lu_factor(J)
+    return lambda b, trans=False: scipy.linalg.lu_solve(lu, b, trans=int(trans))
+
+
+def _color_columns(pattern):
+    """ Greedy grouping of the columns of a sparsity pattern into sets of columns
+    without common rows, each set costing one evaluation of the finite differences.
+    :return: the group of every column, and the number of groups
+    """
+    pattern = pattern.tocsc()
+    n_rows, n_cols = pattern.shape
+    color = np.zeros(n_cols, dtype=np.int64)
+    used = []
+    for j in range(n_cols):
+        rows = pattern.indices[pattern.indptr[j]:pattern.indptr[j+1]]
+        for c, mask in enumerate(used):
+            if not mask[rows].any():
+                break
+        else:
+            c = len(used)
+            used.append(np.zeros(n_rows, dtype=bool))
+        used[c][rows] = True
+        color[j] = c
+    return color, len(used)
+
+
+class FiniteDifferenceJacobian(object):
+    """ Forward difference Jacobian of f. With a sparsity pattern, columns without common
+    rows are perturbed together, so that a banded Jacobian costs a few evaluations of f.
+    With vectorized=True, f is called once on the matrix of all the perturbed points
+    (one point per column) instead of once per point.
+    """
+
+    def __init__(self, f, sparsity=None, vectorized=False):
+        self.f = f
+        self.vectorized = vectorized
+        self.pattern = None
+        if sparsity is not None:
+            import scipy.sparse
+            self.pattern = scipy.sparse.csc_matrix(sparsity)
+            self.color, self.n_colors = _color_columns(self.pattern)
+        self.evaluations = 0
+
+    def __call__(self, x, fx):
+        n = len(x)
+        h = np.sqrt(np.finfo(float).eps) * np.maximum(np.abs(x), 1)
+        if self.pattern is None:
+            directions = np.diag(h)
+        else:
+            directions = np.zeros((n, self.n_colors))
+            directions[np.arange(n), self.color] = h
+        points = x[:, None] + directions
+        if self.vectorized:
+            values = self.f(points)
+            self.evaluations += 1
+        else:
+            values = np.column_stack([self.f(p) for p in points.T])
+            self.evaluations += points.shape[1]
+        diffs = values - fx[:, None]
+        if self.pattern is None:
+            return diffs / h
+        import scipy.sparse
+        rows = self.pattern.indices
+        cols = np.repeat(np.arange(n), np.diff(self.pattern.indptr))
+        data = diffs[rows, self.color[cols]] / h[cols]
+        return scipy.sparse.csc_matrix((data, rows, self.pattern.indptr), shape=self.pattern.shape)
+
+
+def newton_system(f, x0, f1=None, method='newton', refresh=None, epsilon=1e-8, max_iter=100,
+                  sparsity=None, vectorized=False):
+    """
+    Newton and quasi-Newton methods for a system of equations f(x) = 0.
+
+    Parameters
+    ----------
+    f : function
+        The function from R^n to R^n.
+    x0 : array_like
+        The initial guess.
+    f1 : function, optional
+        The Jacobian of f, returning a dense array or a scipy.sparse matrix. The default is
+        FiniteDifferenceJacobian(f, sparsity, vectorized).
+    method : str, optional
+        'newton': the Jacobian is evaluated and factorized at every iteration.
+        'shamanskii': the LU factorization is reused for refresh iterations (chord steps).
+        'chord': the LU factorization of the first Jacobian is reused while it converges.
+        'broyden': Broyden's (good) rank-one updates of the inverse of the factorized
+        Jacobian, with a new factorization after refresh updates.
+        With every method but 'newton', a new Jacobian is factorized as soon as an
+        iteration fails to halve the norm of f. The default is 'newton'.
+    refresh : int, optional
+        The number of iterations using a factorization. The default is 3 for 'shamanskii'
+        and 20 for 'broyden'.
+    epsilon : float, optional
+        The desired accuracy, on the max norm of f(x). The default is 1e-8.
+    max_iter : int, optional
+        The maximum number of iterations. The default is 100.
+    sparsity : array_like or scipy.sparse matrix, optional
+        The sparsity pattern of the Jacobian for the finite differences.
+    vectorized : bool, optional
+        f accepts a n x k matrix of points (as columns) for the finite differences.
+
+    Returns
+    -------
+    x : ndarray
+        The root.
+    stats : dict
+        The numbers of iterations, evaluations of f (including finite differences),
+        evaluations of the Jacobian and LU factorizations.
+
+    Raises
+    ------
+    ValueError
+        If the algorithm does not converge.
+    """
+    refresh = refresh or {'newton': 1, 'shamanskii': 3, 'chord': max_iter, 'broyden': 20}[method]
+    if f1 is None:
+        jacobian = FiniteDifferenceJacobian(f, sparsity, vectorized)
+    else:
+        jacobian = lambda x, fx: f1(x)
+    stats = {'iterations': 0, 'evaluations': 1, 'jacobians': 0, 'factorizations': 0}
+    x = np.array(x0, dtype=float)
+    fx = f(x)
+    solve, age = None, 0
+    # Broyden's updates of the inverse: J^-1 = LU^-1 + sum u v^T.
+    U, V = [], []
+
+    def apply(b):
+        z = solve(b)
+        for u, v in zip(U, V):
+            z += u * (v @ b)
+        return z
+
+    def apply_transpose(b):
+        z = solve(b, trans=True)
+        for u, v in zip(U, V):
+            z += v * (u @ b)
+        return z
+
+    for _ in range(max_iter):
+        norm = np.abs(fx).max()
+        if norm < epsilon:
+            break
+        if solve is None or age >= refresh:
+            solve = _factorize(jacobian(x, fx))
+            stats['jacobians'] += 1
+            stats['factorizations'] += 1
+            age = 0
+            U, V = [], []
+        dx = -apply(fx)
+        x = x + dx
+        fx_new = f(x)
+        stats['evaluations'] += 1
+        stats['iterations'] += 1
+        age += 1
+        if method == 'broyden':
+            y = fx_new - fx
+            Hy = apply(y)
+            v = apply_transpose(dx)
+            denominator = dx @ Hy
+            if denominator != 0:
+                U.append((dx - Hy) / denominator)
+                V.append(v)
+        if method != 'newton' and np.abs(fx_new).max() > norm / 2:
+            age = refresh
+        fx = fx_new
+    else:
+        if np.abs(fx).max() >= epsilon:
+            raise ValueError("Newton's method did not converge")
+    if isinstance(jacobian, FiniteDifferenceJacobian):
+        stats['evaluations'] += jacobian.evaluations
+    return x, stats
+
+
+def test_newton_system():
+    import scipy.sparse
+    n = 2000
+    A = scipy.sparse.diags([-np.ones(n - 1), 4 * np.ones(n), -np.ones(n - 1)], [-1, 0, 1], format='csc')
+    b = np.random.rand(n)
+    f = lambda x: A @ x + x ** 3 - (b if x.ndim == 1 else b[:, None])
+    f1 = lambda x: A + scipy.sparse.diags(3 * x ** 2)
+    for method in ('newton', 'shamanskii', 'chord', 'broyden'):
+        for jac, kwargs in ((f1, {}), (None, {'sparsity': A}), (None, {'sparsity': A, 'vectorized': True})):
+            x, stats = newton_system(f, np.zeros(n), jac, method, **kwargs)
+            assert np.abs(f(x)).max() < 1e-8
+            assert stats['factorizations'] <= stats['iterations']
+    x, stats = newton_system(lambda x: np.array([x[0] ** 2 + x[1] ** 2 - 4, x[0] - x[1]]), [1.0, 2.0])
+    assert np.allclose(x, np.sqrt(2)) and stats['evaluations'] == stats['iterations'] + 1 + 2 * stats['jacobians']
+    print('[test_newton_system] Passed.')
+
+
+def test_root_finding():
+    n = 1000
+    k = np.random.rand(n) * 10 + 0.1
+    f = lambda x, k: x ** 3 - k
+    f1 = lambda x, k: 3 * x ** 2
+    expected = np.cbrt(k)
+    x, iterations, failed = newton_vec(f, f1, np.ones(n), (k,), epsilon=1e-12)
+    assert not failed.any() and np.allclose(x, expected) and (iterations > 0).all()
+    a, b = np.zeros(n), np.full(n, 3.0)
+    for solver in (lambda: newton_bisect(f, f1, a, b, (k,)), lambda: brent(f, a, b, (k,))):
+        x, iterations, failed = solver()
+        assert not failed.any() and np.allclose(x, expected)
+        assert iterations.max() < 60
+    # Brackets without a sign change, and a zero derivative.
+    b[:10] = 0.01
+    for x, _, failed in (newton_bisect(f, f1, a, b, (k,)), brent(f, a, b, (k,))):
+        assert failed[:10].all() and not failed[10:].any() and np.allclose(x[10:], expected[10:])
+    # Brent's method takes the same steps as SciPy's brentq (which also keeps the step before last).
+    try:
+        from scipy.optimize import brentq
+    except ImportError:
+        brentq = None
+    if brentq is not None:
+        c = np.random.default_rng(0).normal(size=(6, 200))
+        g = lambda x, *c: sum(ci * x ** (5 - i) for i, ci in enumerate(c))
+        c = c[:, np.sign(g(-3.0, *c)) != np.sign(g(3.0, *c))]
+        x, iterations, failed = brent(g, np.full(c.shape[1], -3.0), np.full(c.shape[1], 3.0), tuple(c))
+        calls = np.array([brentq(g, -3, 3, tuple(ci), xtol=1e-12, rtol=4 * np.finfo(float).eps,
+                                 full_output=True)[1].function_calls for ci in c.T])
+        # The stopping tests may differ by one step in the last bits.
+        assert not failed.any() and (np.abs(iterations + 2 - calls) <= 1).all()
+        assert (iterations + 2 == calls).mean() > 0.95
+    _, _, failed = newton_vec(lambda x: x ** 2 + 1, lambda x: 2 * x, np.zeros(3))
+    assert failed.all()
+    # A double root reached exactly: f and f1 are both zero there.
+    x, _, failed = newton_vec(lambda x: x ** 2, lambda x: 2 * x, [0.0, 1.0])
+    assert not failed.any() and x[0] == 0 and abs(x[1]) < 1e-5
+    print('[test_root_finding] Passed.')
+
+
 if __name__ == '__main__':
     f = lambda x: x**2 - 2
     f1 = lambda x: 2 * x
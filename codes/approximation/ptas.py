@@ -1,29 +1,34 @@
+import numpy as np
+
+
 def choose_exact(n, k):
-    """ from n items choose k items, enumerate all cases.
-    >>> choose_exact(4, 2)
+    """ from n items choose k items, enumerate all cases lazily.
+    >>> list(choose_exact(4, 2))
     [[0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3]]
-    >>> choose_exact(3, 3)
+    >>> list(choose_exact(3, 3))
     [[0, 1, 2]]
     """
-    if k == 1:
-        return [[i] for i in range(n)]
-    res_mid = choose_exact(n, k - 1)
-    result = []
-    for p in res_mid:
-        for i in range(max(p)+1, n):
-            result.append(p + [i])
-    return result
+    subset = []
+
+    def extend(start):
+        if len(subset) == k:
+            yield list(subset)
+            return
+        for i in range(start, n - (k - len(subset)) + 1):
+            subset.append(i)
+            yield from extend(i + 1)
+            subset.pop()
+
+    return extend(0)
 
 
 def choose_at_most(n, k):
-    """ from n items choose at most k items, enumerate all cases.
-    >>> choose_at_most(4, 2)
-    [[], [0], [1], [2], [3], [0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3], [0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]]
+    """ from n items choose at most k items, enumerate all cases lazily.
+    >>> list(choose_at_most(4, 2))
+    [[], [0], [1], [2], [3], [0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3]]
     """
-    result = []
-    for i in range(1, k+1):
-        result += choose_exact(n, i)
-    return result
+    for i in range(k+1):
+        yield from choose_exact(n, i)
 
 
 def knapsack_greedy(w, v, C):
@@ -43,30 +48,209 @@ def knapsack_greedy(w, v, C):
     return packed_items
 
 
-def knapsack_ptas(w, v, C, k):
+def _ratio_order(w, v):
+    return sorted(range(len(w)), key=lambda i: v[i]/w[i] if w[i] > 0 else np.inf, reverse=True)
+
+
+def _subsets_by_first(ws, vs, C, k, first, keep=None):
+    """ Subsets of at most k items of total weight at most C whose first item is first, the items
+    being sorted by weight, grown one item at a time with their weights and values.
+    A subset is only extended by the following items that fit, found by binary search.
+    :param keep: function of (members, weights, values) giving the mask of the subsets to yield
+        and extend, None to keep all of them
+    :return: generator of (members, weights, values) per size, members having a row per subset
+    """
+    if k == 0 or ws[first] > C:
+        return
+    members = np.array([[first]])
+    W, V = ws[first:first+1], vs[first:first+1]
+    for size in range(k):
+        if size:
+            last = members[:, -1]
+            counts = np.maximum(np.searchsorted(ws, C - W, side='right') - last - 1, 0)
+            if not counts.sum():
+                return
+            rows = np.repeat(np.arange(len(members)), counts)
+            items = last[rows] + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            members = np.column_stack((members[rows], items))
+            W, V = W[rows] + ws[items], V[rows] + vs[items]
+        if keep is not None:
+            mask = keep(members, W, V)
+            members, W, V = members[mask], W[mask], V[mask]
+            if not len(members):
+                return
+        yield members, W, V
+
+
+def _greedy_tables(w, v, order):
+    """ Tables of _greedy_fill: the prefix sums P, PV of the weights and values in the order,
+    the range minima mins[l][t] = min(w[order[t:t + 2^l]]) (inf beyond the last item) and the
+    rank of every item in the order.
+    """
+    n = len(order)
+    ws = w[order]
+    P, PV = np.concatenate(([0], np.cumsum(ws))), np.concatenate(([0], np.cumsum(v[order])))
+    size = 1 << n.bit_length()
+    mins = [np.full(2 * size, np.inf)]
+    mins[0][:n] = ws
+    while (1 << len(mins)) < size:
+        h = 1 << (len(mins) - 1)
+        mins.append(np.minimum(mins[-1], np.append(mins[-1][h:], np.full(h, np.inf))))
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    return P, PV, mins, rank
+
+
+def _greedy_fill(C, tables, members, W, V):
+    """ Values of the subsets completed by the greedy algorithm, all the subsets at once,
+    following the global ratio order and skipping their own items.
+    Every step of a subset jumps to the next item of the order that fits, by descending the
+    range minima, then takes the run of items from there that fit together (up to its next
+    member), by binary search in the prefix sums; a subset stops when no item fits.
+    """
+    P, PV, mins, rank = tables
+    n = len(P) - 1
+    value = V.copy()
+    # The subsets not finished, with their position in the order, room, value and member ranks.
+    active, t, room, val = np.arange(len(W)), np.zeros(len(W), dtype=np.int64), C - W, V.copy()
+    R = rank[members]
+    while len(active):
+        for level in range(len(mins) - 1, -1, -1):
+            t = t + ((mins[level][t] > room) << level)
+        done = t >= n
+        if done.any():
+            value[active[done]] = val[done]
+            alive = ~done
+            active, t, room, val, R = active[alive], t[alive], room[alive], val[alive], R[alive]
+        member = np.where(R >= t[:, None], R, n).min(axis=1, initial=n)
+        skip = member == t
+        end = np.where(skip, t, np.minimum(np.searchsorted(P, P[t] + room, side='right') - 1, member))
+        room = room - (P[end] - P[t])
+        val = val + (PV[end] - PV[t])
+        t = np.where(skip, t + 1, end)
+    return value
+
+
+def _lp_bound(room, tables, members):
+    """ Dantzig bound of the greedy completions: the fractional filling of room with the items
+    in the ratio order other than the members. The break position b is found in the prefix
+    sums P with the room widened by the weights of the members before it, until it is stable.
+    """
+    P, PV, _, rank = tables
+    w, v = np.diff(P), np.diff(PV)
+    ranks = rank[members]
+    mw, mv = w[ranks], v[ranks]
+    b = np.searchsorted(P, room, side='right') - 1
+    wide = room.copy()
+    active = np.flatnonzero((ranks < b[:, None]).any(axis=1))
+    while len(active):
+        wa = room[active] + np.where(ranks[active] < b[active, None], mw[active], 0).sum(axis=1)
+        ba = np.searchsorted(P, wa, side='right') - 1
+        changed = ba != b[active]
+        b[active], wide[active] = ba, wa
+        active = active[changed]
+    value = PV[b] - np.where(ranks < b[:, None], mv, 0).sum(axis=1)
+    i = np.minimum(b, len(w) - 1)
+    rate = np.where(b < len(w), v[i] / np.maximum(w[i], 1e-300), 0)
+    return value + (wide - P[b]) * rate
+
+
+def _best_by_first(w, v, C, k, first, by_weight, tables, lower):
+    """ Best subset starting with the item first (in weight order), completed greedily,
+    if its value exceeds lower. A subset whose Dantzig bound (which also bounds all its
+    supersets) is below the best value found is neither completed nor extended.
+    :param lower: value to beat, at least the value of the greedy algorithm alone
+    :return: total value, subset (original indices), or lower, None
+    """
+    ws, vs = w[by_weight], v[by_weight]
+    best_value, best_subset = lower, None
+    # The items before the first one the greedy algorithm skips all fit together: a subset of
+    # them is completed into the greedy solution itself, which lower is at least worth.
+    P, rank = tables[0], tables[3]
+    prefix = np.searchsorted(P, C, side='right') - 1
+
+    def promising(members, W, V):
+        return V + _lp_bound(C - W, tables, by_weight[members]) >= best_value
+
+    for members, W, V in _subsets_by_first(ws, vs, C, k, first, promising):
+        members = by_weight[members]
+        rows = np.flatnonzero(rank[members].max(axis=1) >= prefix)
+        if not len(rows):
+            continue
+        members, W, V = members[rows], W[rows], V[rows]
+        values = _greedy_fill(C, tables, members, W, V)
+        j = int(np.argmax(values))
+        if values[j] > best_value:
+            best_value, best_subset = values[j], members[j].tolist()
+    return best_value, best_subset
+
+
+def knapsack_ptas(w, v, C, k, n_workers=1):
     """ PTAS for the knapsack problem. Return the indices of the packed items.
+    Every subset of at most k items that fits is completed by the greedy algorithm, and the best
+    completion is returned. Subsets are enumerated lazily with running sums, skipping the
+    items that do not fit and the subsets whose Dantzig bound is below the best value found,
+    and the greedy fills share one order of the items by v/w.
+    :param n_workers: with more than one worker, the subsets are sharded by first item
+        on a process pool, None means the number of CPUs
     """
-    # Step 1: Find the max subset with at most k items and total weight at most C.
     n = len(w)
-    subsets = choose_at_most(n, k)
-    max_value = 0
-    max_subset = []
-    for subset in subsets:
-        total_weight = sum([w[i] for i in subset])
-        total_value = sum([v[i] for i in subset])
-        if total_weight <= C and total_value > max_value:
-            max_value = total_value
-            max_subset = subset
-    
-    # Step 2: Use the greedy algorithm to fill the remaining capacities.
-    remaining_items = [i for i in range(n) if i not in max_subset]
-    remaining_capacity = C - sum([w[i] for i in max_subset])
-    packed_items = knapsack_greedy([w[i] for i in remaining_items], [v[i] for i in remaining_items], remaining_capacity)
-    # Translate the indices of the packed items in Step 2 to the original indices.
-    packed_items = [remaining_items[i] for i in packed_items]
-    
-    # Step 3: Combine the packed items in Step 1 and Step 2.
-    return max_subset + packed_items
+    order = _ratio_order(w, v)
+    w, v = np.asarray(w), np.asarray(v)
+    by_weight = np.argsort(w, kind='stable')
+    tables = _greedy_tables(w, v, order)
+    # The empty subset: the greedy algorithm alone, the value the other subsets have to beat.
+    best_value, best_subset = _greedy_fill(C, tables, np.zeros((1, 0), dtype=np.int64),
+                                           np.zeros(1, dtype=w.dtype), np.zeros(1, dtype=v.dtype))[0], []
+    if n_workers == 1:
+        # Every shard has to beat the best value of the shards before it.
+        for first in range(n):
+            value, subset = _best_by_first(w, v, C, k, first, by_weight, tables, best_value)
+            if value > best_value:
+                best_value, best_subset = value, subset
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        shards = [(w, v, C, k, first, by_weight, tables, best_value) for first in range(n)]
+        with ProcessPoolExecutor(n_workers) as pool:
+            results = list(pool.map(_best_by_first, *zip(*shards), chunksize=max(1, n // 64)))
+        for value, subset in results:
+            if value > best_value:
+                best_value, best_subset = value, subset
+
+    # Fill the remaining capacity of the best subset greedily.
+    taken = set(best_subset)
+    room = C - sum(w[i] for i in best_subset)
+    packed_items = []
+    for i in order:
+        if i not in taken and w[i] <= room:
+            packed_items.append(i)
+            room -= w[i]
+    return [int(i) for i in best_subset] + packed_items
+
+
+def test_knapsack_ptas():
+    import doctest
+    from itertools import combinations
+    assert doctest.testmod().failed == 0
+    for _ in range(50):
+        n = np.random.randint(1, 12)
+        w, v = np.random.randint(1, 30, n).tolist(), np.random.randint(1, 30, n).tolist()
+        C = np.random.randint(1, 80)
+        for k in range(4):
+            # Reference: every subset of at most k items completed by knapsack_greedy.
+            best = 0
+            for size in range(k + 1):
+                for subset in combinations(range(n), size):
+                    if sum(w[i] for i in subset) > C:
+                        continue
+                    rest = [i for i in range(n) if i not in subset]
+                    fill = knapsack_greedy([w[i] for i in rest], [v[i] for i in rest], C - sum(w[i] for i in subset))
+                    best = max(best, sum(v[i] for i in subset) + sum(v[rest[i]] for i in fill))
+            for n_workers in ((1, 2) if k == 2 else (1,)):
+                items = knapsack_ptas(w, v, C, k, n_workers)
+                assert len(set(items)) == len(items) and sum(w[i] for i in items) <= C
+                assert sum(v[i] for i in items) == best
+    print('[test_knapsack_ptas] Passed.')
 
 
 def print_items(items, w, v):
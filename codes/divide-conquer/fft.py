@@ -1,18 +1,105 @@
 import numpy as np
 
 
-def FFT(v):
-    """ Fast Fourier Transform.
+# Per-size plans, keyed by (kind, n): bit-reversal permutations and twiddle factors
+# for radix 2, twiddles and DFT matrices for small radices, chirps for Bluestein.
+_plans = {}
+
+# Largest prime factor handled by mixed radix, larger ones go to Bluestein.
+MAX_RADIX = 7
+
+
+def _plan(n):
+    if ('radix2', n) not in _plans:
+        bits = n.bit_length() - 1
+        rev = np.zeros(n, dtype=np.int64)
+        for b in range(bits):
+            rev |= ((np.arange(n) >> b) & 1) << (bits - 1 - b)
+        _plans['radix2', n] = rev, np.exp(-2j * np.pi * np.arange(n // 2) / n)
+    return _plans['radix2', n]
+
+
+def _radix2(x):
+    """ Iterative radix-2 transform along the last axis: permute by bit reversal, then merge
+    blocks of size 2, 4, ..., n in place.
+    """
+    n = x.shape[-1]
+    rev, twiddles = _plan(n)
+    x = x[..., rev].astype(complex)
+    batch = x.shape[:-1]
+    m = 2
+    while m <= n:
+        half = m // 2
+        blocks = x.reshape(batch + (n // m, m))
+        even, odd = blocks[..., :half], blocks[..., half:]
+        t = odd * twiddles[::n // m]
+        np.subtract(even, t, out=odd)
+        even += t
+        m *= 2
+    return x
+
+
+def _mixed_radix(x, p):
+    """ One decimation-in-time step of radix p: transform the p subsequences x[r::p] of
+    length m = n/p, apply the twiddles exp(-2*pi*i*r*k/n), and combine with a DFT of size p.
+    """
+    n = x.shape[-1]
+    m = n // p
+    if ('radix', n, p) not in _plans:
+        r = np.arange(p)
+        _plans['radix', n, p] = (np.exp(-2j * np.pi * np.outer(r, np.arange(m)) / n),
+                                 np.exp(-2j * np.pi * np.outer(r, r) / p))
+    twiddles, dft = _plans['radix', n, p]
+    y = _fft(np.swapaxes(x.reshape(x.shape[:-1] + (m, p)), -1, -2)) * twiddles
+    return (dft @ y).reshape(x.shape)
+
+
+def _bluestein(x):
+    """ Chirp-z transform: with c[j] = exp(-pi*i*j^2/n), X[k] = c[k] * sum_j x[j] c[j] / c[k-j],
+    a convolution done by radix-2 transforms of a power of two length at least 2n-1.
     """
-    n = len(v)
-    if n == 1:
-        return v
-    v_even = FFT(v[0:n:2])
-    v_odd = FFT(v[1:n:2])
-    u = [np.e ** (-2 * np.pi * complex(0, 1) * j / n) for j in range(n//2)]
-    part1 = [v_even[i] + u[i]*v_odd[i] for i in range(n//2)]
-    part2 = [v_even[i] - u[i]*v_odd[i] for i in range(n//2)]
-    return part1 + part2
+    n = x.shape[-1]
+    if ('bluestein', n) not in _plans:
+        c = np.exp(-1j * np.pi * (np.arange(n) ** 2 % (2 * n)) / n)
+        size = 1 << (2 * n - 2).bit_length()
+        b = np.zeros(size, dtype=complex)
+        b[:n] = np.conj(c)
+        b[size - n + 1:] = np.conj(c[1:])[::-1]
+        _plans['bluestein', n] = c, _radix2(b)
+    c, b = _plans['bluestein', n]
+    a = np.zeros(x.shape[:-1] + (len(b),), dtype=complex)
+    a[..., :n] = x * c
+    return np.conj(_radix2(np.conj(_radix2(a) * b)))[..., :n] / len(b) * c
+
+
+def _smallest_factor(n):
+    for p in range(2, MAX_RADIX + 1):
+        if n % p == 0:
+            return p
+    return None
+
+
+def _fft(x):
+    """ Transform along the last axis, for any length. """
+    n = x.shape[-1]
+    if n & (n - 1) == 0:
+        return _radix2(x)
+    p = _smallest_factor(n)
+    if p is None:
+        return _bluestein(x)
+    return _mixed_radix(x, p)
+
+
+def FFT(v, axis=-1):
+    """ Fast Fourier Transform of any length.
+    Powers of two use an iterative in-place radix-2 transform, lengths with small prime factors
+    use mixed radix steps, and the other ones Bluestein's chirp-z algorithm.
+    A 2-D array is transformed along axis.
+    """
+    v = np.asarray(v)
+    if v.shape[axis] == 0:
+        return v.astype(complex)
+    return np.moveaxis(_fft(np.moveaxis(v, axis, -1)), -1, axis)
 
 
 def test_fft():
@@ -24,16 +111,180 @@ def test_fft():
     print('[FFT] test passed.')
 
 
-def iFFT(v):
-    """ Inverse of the Fast Fourier Transform.
+def iFFT(v, axis=-1):
+    """ Inverse of the Fast Fourier Transform, by conjugating the input and output of FFT.
+    """
+    v = np.asarray(v)
+    return np.conj(FFT(np.conj(v), axis)) / v.shape[axis]
+
+
+def test_ifft():
+    for k in range(10):
+        v = np.random.rand(3, pow(2, k)) + 1j * np.random.rand(3, pow(2, k))
+        assert np.allclose(iFFT(FFT(v)), v)
+        assert np.allclose(FFT(v.T, axis=0), np.fft.fft(v.T, axis=0))
+    for n in list(range(1, 100)) + [210, 1000, 1009, 3 * 1021, 44100]:
+        v = np.random.rand(2, n) + 1j * np.random.rand(2, n)
+        assert np.allclose(FFT(v), np.fft.fft(v))
+        assert np.allclose(iFFT(FFT(v)), v)
+    print('[iFFT] test passed.')
+
+
+def _fft_size(n):
+    return 1 << max(n - 1, 0).bit_length()
+
+
+def _result(y, *inputs):
+    """ Drops the imaginary part of y if all the inputs are real. """
+    if any(np.iscomplexobj(a) for a in inputs):
+        return y
+    return y.real
+
+
+def convolve(a, b):
+    """ Linear convolution of a and b, of length len(a) + len(b) - 1, by FFT. """
+    a, b = np.asarray(a), np.asarray(b)
+    n = len(a) + len(b) - 1
+    size = _fft_size(n)
+    fa = FFT(np.concatenate((a, np.zeros(size - len(a)))))
+    fb = FFT(np.concatenate((b, np.zeros(size - len(b)))))
+    return _result(iFFT(fa * fb)[:n], a, b)
+
+
+def polymul(p, q):
+    """ Product of the polynomials with coefficients p and q (in the same order, as in np.polymul).
+    Integer coefficients are multiplied exactly by the number-theoretic transform.
+    Leading zeros are dropped first, as np.polymul does.
     """
-    n = len(v)
-    u = FFT(v)
-    x = [i/n for i in u]  # u divided by n
-    # Reverse the last n-1 elements
-    y = x[1:]
-    y.reverse()  
-    return x[0:1] + y
+    p, q = (np.trim_zeros(np.atleast_1d(a), 'f') for a in (p, q))
+    p, q = (a if len(a) else np.zeros(1, dtype=a.dtype) for a in (p, q))
+    if all(np.issubdtype(a.dtype, np.integer) or a.dtype == object for a in (p, q)):
+        from ntt import ntt_convolve
+        return ntt_convolve(p, q)
+    return convolve(p, q)
+
+
+def _blocks(chunks, size):
+    """ Regroups chunks (an array, e.g. a memmap, or an iterable of arrays) into
+    blocks of the given size, the last one possibly shorter.
+    """
+    if isinstance(chunks, np.ndarray):
+        for i in range(0, len(chunks), size):
+            yield np.asarray(chunks[i:i+size])
+        return
+    buffer, length = [], 0
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        while length + len(chunk) >= size:
+            k = size - length
+            buffer.append(chunk[:k])
+            yield np.concatenate(buffer)
+            buffer, length, chunk = [], 0, chunk[k:]
+        if len(chunk):
+            buffer.append(chunk)
+            length += len(chunk)
+    if length:
+        yield np.concatenate(buffer)
+
+
+def _stream_plan(h, block):
+    """ Block length and FFT of the filter h zero-padded to the transform size. """
+    m = len(h)
+    if block is None:
+        block = _fft_size(8 * m) - m + 1
+    size = _fft_size(block + m - 1)
+    return block, size, FFT(np.concatenate((h, np.zeros(size - m))))
+
+
+def overlap_add(chunks, h, block=None):
+    """ Streaming linear convolution of a long signal with the filter h, by overlap-add:
+    every block is convolved on its own and the last len(h)-1 outputs overlap the next block.
+    Only one block is in memory at a time.
+    :param chunks: the signal, an array (e.g. a memmap) or an iterable of arrays of any lengths
+    :param h: the filter
+    :param block: number of input samples per transform, default is about 8 len(h)
+    :return: generator of output arrays, together equal to convolve(signal, h)
+    """
+    h = np.asarray(h)
+    m = len(h)
+    block, size, fh = _stream_plan(h, block)
+    tail = None
+    for x in _blocks(chunks, block):
+        fx = FFT(np.concatenate((x, np.zeros(size - len(x)))))
+        y = _result(iFFT(fx * fh)[:len(x) + m - 1], x, h)
+        if tail is not None:
+            y[:m - 1] += tail
+        yield y[:len(x)]
+        tail = y[len(x):]
+    if tail is not None and len(tail):
+        yield tail
+
+
+def overlap_save(chunks, h, block=None):
+    """ Streaming linear convolution of a long signal with the filter h, by overlap-save:
+    every block is prefixed with the last len(h)-1 input samples, and the first len(h)-1
+    outputs of its circular convolution, which wrap around, are discarded.
+    Arguments and output are as in overlap_add.
+    """
+    h = np.asarray(h)
+    m = len(h)
+    block, size, fh = _stream_plan(h, block)
+    history = None
+    complex_input = np.iscomplexobj(h)
+
+    def step(x):
+        seg = np.concatenate((history, x))
+        y = iFFT(FFT(np.concatenate((seg, np.zeros(size - len(seg))))) * fh)[m - 1:len(seg)]
+        return seg[len(seg) - m + 1:], y if complex_input else y.real
+
+    for x in _blocks(chunks, block):
+        if history is None:
+            history = np.zeros(m - 1, dtype=x.dtype)
+        complex_input |= np.iscomplexobj(x)
+        history, y = step(x)
+        yield y
+    if history is not None:
+        for x in _blocks(np.zeros(m - 1, dtype=history.dtype), block):
+            history, y = step(x)
+            yield y
+
+
+def test_convolve():
+    for _ in range(20):
+        a = np.random.randint(-50, 50, np.random.randint(1, 60))
+        b = np.random.randint(-50, 50, np.random.randint(1, 60))
+        assert np.allclose(convolve(a, b), np.convolve(a, b))
+        assert np.array_equal(polymul(a, b), np.polymul(a, b))
+        assert np.array_equal(polymul(np.append(0, a), [0, 0]), np.polymul(np.append(0, a), [0, 0]))
+    for _ in range(20):
+        n, m = np.random.randint(1, 3000), np.random.randint(1, 100)
+        x, h = np.random.rand(n), np.random.rand(m)
+        expected = np.convolve(x, h)
+        sizes = np.random.randint(0, 400, 50)
+        chunks = (x[i:j] for i, j in zip(np.concatenate(([0], np.cumsum(sizes))), np.cumsum(sizes)))
+        rest = x[sizes.sum():]
+        for stream in (overlap_add, overlap_save):
+            assert np.allclose(np.concatenate(list(stream(x, h, block=np.random.randint(1, 300)))), expected)
+            gen = (c for part in (chunks, [rest]) for c in part)
+            assert np.allclose(np.concatenate(list(stream(gen, h))), expected)
+            chunks = (x[i:j] for i, j in zip(np.concatenate(([0], np.cumsum(sizes))), np.cumsum(sizes)))
+    print('[convolve] test passed.')
+
+
+def benchmark(sizes=tuple(pow(2, k) for k in range(10, 21, 2)), repeat=3):
+    """ Compare FFT with np.fft.fft. """
+    import time
+    for n in sizes:
+        v = np.random.rand(n)
+        FFT(v)  # build the plan
+        times = []
+        for f in (FFT, np.fft.fft):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                f(v)
+            times.append((time.perf_counter() - start) / repeat)
+        print(f"[benchmark] n = {n}: FFT {times[0] * 1e3:.2f}ms, "
+              f"np.fft.fft {times[1] * 1e3:.2f}ms, ratio {times[0] / times[1]:.1f}")
 
 
 if __name__ == '__main__':
@@ -1,29 +1,354 @@
-def merge_sort(arr):
+import heapq
+import os
+import tempfile
+
+import numpy as np
+
+
+# Runs shorter than MIN_RUN are extended by binary insertion sort.
+MIN_RUN = 32
+
+
+def merge_sort_recursive(arr):
     if len(arr) <= 1:
         return arr
     mid = len(arr) // 2
-    left = merge_sort(arr[:mid])
-    right = merge_sort(arr[mid:])
+    left = merge_sort_recursive(arr[:mid])
+    right = merge_sort_recursive(arr[mid:])
     return merge(left, right)
 
 
 def merge(left, right):
+    """ Stable merge: on equal elements the one of left comes first. """
     result = []
     i = j = 0
     while i < len(left) and j < len(right):
-        if left[i] < right[j]:
-            result.append(left[i])
-            i += 1
-        else:
+        if right[j] < left[i]:
             result.append(right[j])
             j += 1
+        else:
+            result.append(left[i])
+            i += 1
     result += left[i:]
     result += right[j:]
     return result
 
 
+def _reverse(K, V, a, b):
+    K[a:b] = K[a:b][::-1]
+    if V is not None:
+        V[a:b] = V[a:b][::-1]
+
+
+def _insertion_sort(K, V, a, j, b):
+    """ Binary insertion sort of K[a:b] (and V along if not None), K[a:j] being sorted. """
+    for t in range(j, b):
+        k = K[t]
+        lo, hi = a, t
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if k < K[mid]:
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo < t:
+            K[lo+1:t+1] = K[lo:t]
+            K[lo] = k
+            if V is not None:
+                v = V[t]
+                V[lo+1:t+1] = V[lo:t]
+                V[lo] = v
+
+
+def _natural_runs(K, V):
+    """ Splits K into natural runs, reversing the strictly descending ones and extending the
+    short ones to MIN_RUN by insertion sort.
+    :return: the ends of the runs
+    """
+    n = len(K)
+    ends = []
+    a = 0
+    while a < n:
+        j = a + 1
+        if j < n and K[j] < K[a]:
+            while j + 1 < n and K[j+1] < K[j]:
+                j += 1
+            j += 1
+            _reverse(K, V, a, j)
+        else:
+            while j < n and not K[j] < K[j-1]:
+                j += 1
+        b = min(max(j, a + MIN_RUN), n)
+        _insertion_sort(K, V, a, j, b)
+        ends.append(b)
+        a = b
+    return ends
+
+
+def _merge_runs(K, K2, a, m, b):
+    """ Merges the runs K[a:m] and K[m:b] into K2[a:b]; runs already in order are copied. """
+    if m == b or not K[m] < K[m-1]:
+        K2[a:b] = K[a:b]
+        return
+    i, j, o = a, m, a
+    ki, kj = K[i], K[j]
+    while True:
+        if kj < ki:
+            K2[o] = kj
+            o += 1
+            j += 1
+            if j == b:
+                break
+            kj = K[j]
+        else:
+            K2[o] = ki
+            o += 1
+            i += 1
+            if i == m:
+                break
+            ki = K[i]
+    K2[o:o+m-i] = K[i:m]
+    K2[o+m-i:b] = K[j:b]
+
+
+def _merge_runs_keyed(K, V, K2, V2, a, m, b):
+    """ Merges the runs K[a:m] and K[m:b] into K2[a:b], the values V following their keys. """
+    if m == b or not K[m] < K[m-1]:
+        K2[a:b], V2[a:b] = K[a:b], V[a:b]
+        return
+    i, j, o = a, m, a
+    ki, kj = K[i], K[j]
+    while True:
+        if kj < ki:
+            K2[o], V2[o] = kj, V[j]
+            o += 1
+            j += 1
+            if j == b:
+                break
+            kj = K[j]
+        else:
+            K2[o], V2[o] = ki, V[i]
+            o += 1
+            i += 1
+            if i == m:
+                break
+            ki = K[i]
+    K2[o:o+m-i], V2[o:o+m-i] = K[i:m], V[i:m]
+    K2[o+m-i:b], V2[o+m-i:b] = K[j:b], V[j:b]
+
+
+def _merge_passes(K, V, ends):
+    """ Bottom-up merging of the runs ending at ends, ping-ponging between K (and V if not None)
+    and two buffers.
+    :return: the sorted V, or K if V is None
+    """
+    K2 = [None] * len(K)
+    V2 = None if V is None else [None] * len(V)
+    bounds = [0] + ends
+    while len(bounds) > 2:
+        merged = [0]
+        for t in range(0, len(bounds) - 1, 2):
+            a, m = bounds[t], bounds[t+1]
+            b = bounds[t+2] if t + 2 < len(bounds) else m
+            if V is None:
+                _merge_runs(K, K2, a, m, b)
+            else:
+                _merge_runs_keyed(K, V, K2, V2, a, m, b)
+            merged.append(b)
+        bounds = merged
+        K, V, K2, V2 = K2, V2, K, V
+    return K if V is None else V
+
+
+def merge_sort(arr, key=None, reverse=False, n_workers=1):
+    """ Stable bottom-up merge sort, with the same arguments and result as sorted().
+    Natural runs are detected and short ones extended by insertion sort, then runs are merged
+    pairwise, level by level, between two preallocated buffers. A descending sort is the
+    ascending sort of the reversed list, reversed, which keeps equal elements in their order.
+    :param arr: iterable
+    :param key: function of the elements to compare
+    :param reverse: sort in descending order
+    :param n_workers: with more than one worker, chunks are sorted on a process pool and then merged
+        (key must be picklable), None means the number of CPUs
+    :return: sorted list
+    """
+    V = list(arr)
+    if reverse:
+        V.reverse()
+    ends = None
+    if n_workers != 1 and len(V) > 1:
+        V, ends = _sort_chunks(V, key, n_workers)
+    K = V if key is None else list(map(key, V))
+    if key is None:
+        V = None
+    if ends is None:
+        ends = _natural_runs(K, V)
+    result = _merge_passes(K, V, ends)
+    if reverse:
+        result.reverse()
+    return result
+
+
+def _sort_chunk(chunk, key):
+    return merge_sort(chunk, key)
+
+
+def _sort_chunks(V, key, n_workers):
+    """ Sorts n_workers chunks of V on a process pool.
+    :return: the concatenated sorted chunks and their ends
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    n_workers = n_workers or os.cpu_count()
+    size = -(-len(V) // n_workers)
+    starts = range(0, len(V), size)
+    with ProcessPoolExecutor(n_workers) as pool:
+        chunks = pool.map(_sort_chunk, (V[s:s+size] for s in starts), [key] * len(starts))
+        for s, chunk in zip(starts, chunks):
+            V[s:s+len(chunk)] = chunk
+    return V, [min(s + size, len(V)) for s in starts]
+
+
+def test_merge_sort():
+    import operator
+    for _ in range(200):
+        n = np.random.randint(0, 300)
+        arr = [(int(x), i) for i, x in enumerate(np.random.randint(0, 20, n))]
+        if np.random.rand() < 0.5:
+            arr.sort(reverse=np.random.rand() < 0.5)
+        for key in (None, operator.itemgetter(0)):
+            for reverse in (False, True):
+                assert merge_sort(arr, key, reverse) == sorted(arr, key=key, reverse=reverse)
+    assert merge_sort_recursive([3, 1, 2]) == [1, 2, 3]
+    arr = [(int(x), i) for i, x in enumerate(np.random.randint(0, 100, 5000))]
+    assert merge_sort(arr, operator.itemgetter(0), True, n_workers=3) == sorted(arr, key=operator.itemgetter(0), reverse=True)
+    print('[test_merge_sort] Passed.')
+
+
+def benchmark(sizes=(10**4, 10**5, 10**6), n_workers=None):
+    """ Compare merge_sort (sequential and parallel), merge_sort_recursive and sorted(). """
+    import time
+    for n in sizes:
+        arr = np.random.rand(n).tolist()
+        times = []
+        for f in (merge_sort, lambda a: merge_sort(a, n_workers=n_workers), merge_sort_recursive, sorted):
+            start = time.perf_counter()
+            f(arr)
+            times.append(time.perf_counter() - start)
+        print(f"[benchmark] n = {n}: merge_sort {times[0]:.2f}s, parallel {times[1]:.2f}s, "
+              f"recursive {times[2]:.2f}s, sorted {times[3]:.3f}s")
+
+
+def _keys(a, order):
+    return a if order is None else a[order]
+
+
+def _spill_runs(data, order, run_size, tmpdir):
+    """ Sorts data by chunks of run_size records and writes every sorted run to a memory-mapped file. """
+    runs = []
+    for i in range(0, len(data), run_size):
+        chunk = np.array(data[i:i+run_size])
+        run = np.memmap(os.path.join(tmpdir, f'run{len(runs)}.bin'), dtype=data.dtype, mode='w+', shape=len(chunk))
+        run[:] = chunk[np.argsort(_keys(chunk, order), kind='stable')]
+        run.flush()
+        runs.append(run)
+    return runs
+
+
+def kway_merge(runs, order=None, buffer_size=1 << 16):
+    """ Stable k-way merge of sorted arrays (e.g. memmaps), reading buffer_size records of each at a time.
+    A heap holds the last buffered key of every run. The smallest one is a bound up to which
+    every buffered record can be output: the records with smaller keys, and the ones with
+    equal keys from the runs up to the one with the bound, so that equal keys keep the order of the runs.
+    :param runs: sorted arrays
+    :param order: sort key, a field name or a list of field names of structured records,
+        default is the whole records
+    :param buffer_size: records read from a run at a time
+    :return: generator of sorted blocks
+    """
+    pos = [0] * len(runs)
+    buffers = [None] * len(runs)
+    heap = []
+
+    def refill(r):
+        buffers[r] = np.array(runs[r][pos[r]:pos[r] + buffer_size])
+        pos[r] += len(buffers[r])
+        if len(buffers[r]):
+            heapq.heappush(heap, (_keys(buffers[r], order)[-1].item(), r))
+
+    for r in range(len(runs)):
+        refill(r)
+    while heap:
+        _, r0 = heapq.heappop(heap)
+        bound = _keys(buffers[r0], order)[-1]
+        pieces = []
+        for r, buffer in enumerate(buffers):
+            j = np.searchsorted(_keys(buffer, order), bound, side='right' if r <= r0 else 'left')
+            if j:
+                pieces.append(buffer[:j])
+                buffers[r] = buffer[j:]
+        block = np.concatenate(pieces)
+        yield block[np.argsort(_keys(block, order), kind='stable')]
+        refill(r0)
+
+
+def external_sort(data, dtype=None, order=None, memory=1 << 27, tmpdir=None):
+    """ Out-of-core stable merge sort of binary records: sorted runs of a fixed size are
+    spilled to memory-mapped temporary files, then merged by kway_merge.
+    :param data: array, memmap or path of a file of records
+    :param dtype: dtype of the records of a file
+    :param order: sort key, a field name or a list of field names of structured records,
+        default is the whole records
+    :param memory: memory budget in bytes, for a run while sorting and for all the buffers while merging
+    :param tmpdir: directory of the temporary files, default is the system's
+    :return: generator of sorted blocks
+    """
+    if isinstance(data, (str, os.PathLike)):
+        data = np.memmap(data, dtype=dtype, mode='r')
+    itemsize = data.dtype.itemsize
+    # Sorting a run needs a copy, the sorted copy and the permutation.
+    run_size = max(1, memory // (2 * itemsize + 8))
+    with tempfile.TemporaryDirectory(dir=tmpdir) as d:
+        runs = _spill_runs(data, order, run_size, d)
+        # The buffers, the output block and its sorted copy.
+        buffer_size = max(1, memory // (3 * max(len(runs), 1) * itemsize + 8))
+        yield from kway_merge(runs, order, buffer_size)
+        del runs
+
+
+def external_sort_file(src, dst, dtype, order=None, memory=1 << 27, tmpdir=None):
+    """ Sorts the file of records src into the file dst with external_sort.
+    :return: number of records
+    """
+    n = 0
+    with open(dst, 'wb') as f:
+        for block in external_sort(src, dtype, order, memory, tmpdir):
+            block.tofile(f)
+            n += len(block)
+    return n
+
+
+def test_external_sort():
+    dtype = np.dtype([('key', '<i4'), ('sub', '<f8'), ('id', '<i8')])
+    for _ in range(20):
+        n = np.random.randint(0, 5000)
+        a = np.zeros(n, dtype)
+        a['key'], a['sub'], a['id'] = np.random.randint(0, 50, n), np.random.randint(0, 3, n), np.arange(n)
+        memory = np.random.randint(10, 100) * 1000
+        for order in ('key', ['key', 'sub']):
+            out = np.concatenate([np.empty(0, dtype)] + list(external_sort(a, order=order, memory=memory)))
+            assert np.array_equal(out, a[np.argsort(a[order], kind='stable')])
+        v = np.random.randint(0, 1000, n)
+        out = np.concatenate([np.empty(0, v.dtype)] + list(external_sort(v, memory=memory)))
+        assert np.array_equal(out, np.sort(v))
+    with tempfile.TemporaryDirectory() as d:
+        src, dst = os.path.join(d, 'src.bin'), os.path.join(d, 'dst.bin')
+        a.tofile(src)
+        assert external_sort_file(src, dst, dtype, order='key', memory=10**4) == len(a)
+        assert np.array_equal(np.fromfile(dst, dtype), a[np.argsort(a['key'], kind='stable')])
+    print('[test_external_sort] Passed.')
+
+
 if __name__ == '__main__':
-    import numpy as np
     arr = np.random.randint(1, 100, 10).tolist()
     print(f">> input: {arr}")
     print(f">> output: {merge_sort(arr)}")
\ No newline at end of file
@@ -0,0 +1,234 @@
+import numpy as np
+
+from fft import _plan
+
+
+# NTT-friendly primes p = c * 2^k + 1 below 2^31, so that products of two residues fit
+# in int64, with a primitive root g. Transform lengths are powers of two up to 2^23.
+NTT_PRIMES = ((998244353, 3), (167772161, 3), (469762049, 3), (754974721, 11), (1224736769, 3))
+MAX_LENGTH = 1 << 23
+LAZY_STAGES = 4
+
+# Twiddle factors keyed by (p, n, inverse): powers w^k, k < n/2, of a root of unity of order n.
+_roots = {}
+
+
+def _twiddles(p, g, n, inverse):
+    if (p, n, inverse) not in _roots:
+        w = pow(g, (p - 1) // n, p)
+        if inverse:
+            w = pow(w, p - 2, p)
+        powers = np.ones(max(n // 2, 1), dtype=np.int64)
+        k = 1
+        while k < n // 2:
+            powers[k:2*k] = powers[:k] * pow(w, k, p) % p
+            k *= 2
+        _roots[p, n, inverse] = powers
+    return _roots[p, n, inverse]
+
+
+def ntt(a, p, g, inverse=False):
+    """ Number-theoretic transform modulo p along the last axis: the radix-2 FFT with
+    the roots of unity of Z/pZ instead of the complex ones.
+    :param a: int64 array of residues, the length is a power of two
+    :param p: prime with p - 1 divisible by the length
+    :param g: primitive root modulo p
+    :param inverse: inverse transform, including the division by the length
+    :return: transformed array
+    """
+    n = a.shape[-1]
+    rev, _ = _plan(n)
+    twiddles = _twiddles(p, g, n, inverse)
+    x = a[..., rev] % p
+    batch = x.shape[:-1]
+    t = np.empty(batch + (n // 2,), dtype=np.int64)
+    m, lazy = 2, 0
+    while m <= n:
+        # Values stay below (lazy + 1) p, reduced every LAZY_STAGES stages so that
+        # the products with the twiddles fit in int64.
+        if lazy == LAZY_STAGES:
+            x %= p
+            lazy = 0
+        half = m // 2
+        blocks = x.reshape(batch + (n // m, m))
+        even, odd = blocks[..., :half], blocks[..., half:]
+        tb = t.reshape(even.shape)
+        np.multiply(odd, twiddles[::n // m], out=tb)
+        tb %= p
+        np.subtract(even, tb, out=odd)
+        odd += p
+        even += tb
+        m *= 2
+        lazy += 1
+    x %= p
+    if inverse:
+        x = x * pow(n, p - 2, p) % p
+    return x
+
+
+def _residues(a, p):
+    """ a modulo p as int64, for integers of any size. """
+    if a.dtype == object:
+        return np.array([int(v) % p for v in a], dtype=np.int64)
+    return a % p
+
+
+def _mixed_radix(residues, primes):
+    """ Mixed-radix digits t_i of the CRT recombination: x = t_0 + p_0 (t_1 + p_1 (t_2 + ...)),
+    0 <= t_i < p_i, found in int64.
+    """
+    digits = []
+    for i, (r, p) in enumerate(zip(residues, primes)):
+        t = r
+        for tj, pj in zip(digits, primes):
+            t = (t - tj) % p * pow(pj, p - 2, p) % p
+        digits.append(t)
+    return digits
+
+
+def _garner(residues, primes):
+    """ CRT recombination of the residues modulo the primes, in the symmetric range
+    (-M/2, M/2] with M the product of the primes.
+    The value is built from the mixed-radix digits in int64 if M < 2^62 and with Python
+    integers otherwise.
+    """
+    digits = _mixed_radix(residues, primes)
+    M = int(np.prod([int(p) for p in primes], dtype=object))
+    dtype = np.int64 if M < 1 << 62 else object
+    x = digits[-1].astype(dtype)
+    for t, p in zip(digits[-2::-1], primes[-2::-1]):
+        x = x * p + t.astype(dtype)
+    return np.where(x > M // 2, x - M, x)
+
+
+def _max_abs(a):
+    if a.dtype == object:
+        return max(abs(int(v)) for v in a)
+    return int(np.abs(a).max())
+
+
+def ntt_convolve(a, b):
+    """ Exact linear convolution of integer sequences by NTT, with as many primes as
+    the size of the coefficients requires and CRT recombination.
+    :param a: integers (of any size)
+    :param b: integers (of any size)
+    :return: int64 array, or object array of Python integers if the result needs more than 62 bits
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype != object:
+        a = a.astype(np.int64)
+    if b.dtype != object:
+        b = b.astype(np.int64)
+    n = len(a) + len(b) - 1
+    size = 1 << max(n - 1, 0).bit_length()
+    if size > MAX_LENGTH:
+        raise ValueError(f"NTT: the length {size} exceeds {MAX_LENGTH}.")
+    bound = 2 * min(len(a), len(b)) * _max_abs(a) * _max_abs(b)
+    primes, M = [], 1
+    for p, g in NTT_PRIMES:
+        if primes and M > bound:
+            break
+        primes.append((p, g))
+        M *= p
+    if M <= bound:
+        raise ValueError("NTT: the coefficients are too large.")
+    residues = _ntt_residues(a, b, primes, n, size)
+    return _garner(residues, [p for p, _ in primes])
+
+
+def _ntt_residues(a, b, primes, n, size):
+    """ Linear convolution of a and b modulo each of the primes, by transforms of length size. """
+    residues = []
+    for p, g in primes:
+        ab = np.zeros((2, size), dtype=np.int64)
+        ab[0, :len(a)], ab[1, :len(b)] = _residues(a, p), _residues(b, p)
+        fa, fb = ntt(ab, p, g)
+        residues.append(ntt(fa * fb % p, p, g, inverse=True)[:n])
+    return residues
+
+
+def _to_limbs(x, bits=16):
+    """ Limbs of bits = 16 or 32 bits of the nonnegative integer x, least significant first. """
+    size = bits // 8
+    data = x.to_bytes((x.bit_length() + bits - 1) // bits * size or size, 'little')
+    return np.frombuffer(data, dtype=f'<u{size}').astype(np.int64)
+
+
+def _from_limbs(c):
+    """ sum_i c[i] 2^(16 i) for nonnegative c[i] < 2^64, from the four 16 bit pieces of c. """
+    c = c.astype(np.uint64)
+    x = 0
+    for k in range(4):
+        piece = ((c >> np.uint64(16 * k)) & np.uint64(0xffff)).astype('<u2')
+        x += int.from_bytes(piece.tobytes(), 'little') << (16 * k)
+    return x
+
+
+# Limbs of multiply: 32 bits with the first three primes, whose product (about 2^86) exceeds the
+# coefficients of the products of up to 2^22 limbs; 16 bits and ntt_convolve beyond.
+LIMB_BITS = 32
+LIMB_PRIMES = 3
+
+
+def multiply(x, y):
+    """ Exact product of two integers by NTT of their limbs. With 32 bit limbs the mixed-radix
+    digits of every coefficient (each below 2^31) are read as three integers in base 2^32
+    X_0, X_1, X_2, and the product is X_0 + p_0 X_1 + p_0 p_1 X_2.
+    """
+    sign = -1 if (x < 0) != (y < 0) else 1
+    x, y = abs(x), abs(y)
+    if x == 0 or y == 0:
+        return 0
+    a, b = _to_limbs(x, LIMB_BITS), _to_limbs(y, LIMB_BITS)
+    primes = NTT_PRIMES[:LIMB_PRIMES]
+    M = int(np.prod([p for p, _ in primes], dtype=object))
+    n = len(a) + len(b) - 1
+    size = 1 << max(n - 1, 0).bit_length()
+    if min(len(a), len(b)) * ((1 << LIMB_BITS) - 1) ** 2 >= M or size > MAX_LENGTH:
+        return sign * _from_limbs(ntt_convolve(_to_limbs(x), _to_limbs(y)))
+    digits = _mixed_radix(_ntt_residues(a, b, primes, n, size), [p for p, _ in primes])
+    z, scale = 0, 1
+    for t, (p, _) in zip(digits, primes):
+        z += scale * int.from_bytes(t.astype('<u4').tobytes(), 'little')
+        scale *= p
+    return sign * z
+
+
+def test_ntt():
+    for _ in range(50):
+        a = np.random.randint(-1000, 1000, np.random.randint(1, 100))
+        b = np.random.randint(-1000, 1000, np.random.randint(1, 100))
+        assert np.array_equal(ntt_convolve(a, b), np.convolve(a, b))
+        assert np.array_equal(ntt_convolve(0 * a, b), np.zeros(len(a) + len(b) - 1))
+        big = np.array([int(v) << 60 for v in a], dtype=object)
+        assert list(ntt_convolve(big, b)) == list(np.convolve(a.astype(object), b.astype(object)) << 60)
+    import random
+    for _ in range(20):
+        x = random.getrandbits(random.randint(1, 20000)) * random.choice((-1, 1))
+        y = random.getrandbits(random.randint(1, 20000)) * random.choice((-1, 1))
+        assert multiply(x, y) == x * y
+    print('[NTT] test passed.')
+
+
+def benchmark(digits=(10**4, 10**5, 10**6)):
+    """ Compare multiply with Python's integer product (Karatsuba). multiply breaks even
+    between 10^5 and 3 * 10^5 decimal digits and is about twice as fast at 10^6; below
+    10^5 digits the int product is faster.
+    """
+    import random
+    import time
+    for d in digits:
+        bits = int(d * 3.3219)
+        x, y = random.getrandbits(bits), random.getrandbits(bits)
+        start = time.perf_counter()
+        z = multiply(x, y)
+        t_ntt = time.perf_counter() - start
+        start = time.perf_counter()
+        assert z == x * y
+        t_int = time.perf_counter() - start
+        print(f"[benchmark] {d} digits: multiply {t_ntt:.3f}s, int {t_int:.3f}s")
+
+
+if __name__ == '__main__':
+    test_ntt()
+    benchmark()
@@ -1,39 +1,315 @@
 import numpy as np
 
 
-def simple_divide_and_conquer(A, B):
-    n = A.shape[0]
-    if n == 1:
-        return A * B
-    else:
-        A11, A12, A21, A22 = A[:n//2, :n//2], A[:n//2, n//2:], A[n//2:, :n//2], A[n//2:, n//2:]
-        B11, B12, B21, B22 = B[:n//2, :n//2], B[:n//2, n//2:], B[n//2:, :n//2], B[n//2:, n//2:]
-        C11 = simple_divide_and_conquer(A11, B11) + simple_divide_and_conquer(A12, B21)
-        C12 = simple_divide_and_conquer(A11, B12) + simple_divide_and_conquer(A12, B22)
-        C21 = simple_divide_and_conquer(A21, B11) + simple_divide_and_conquer(A22, B21)
-        C22 = simple_divide_and_conquer(A21, B12) + simple_divide_and_conquer(A22, B22)
-        return np.vstack((np.hstack((C11, C12)), np.hstack((C21, C22))))
-
-
-def strassen(A, B):
-    n = A.shape[0]
-    if n == 1:
-        return A * B
+# Blocks with a side at most STRASSEN_CUTOFF are multiplied by BLAS; tune_cutoff picks it for the host.
+STRASSEN_CUTOFF = 256
+
+
+def _padded_shape(m, k, n, cutoff, min_depth=0):
+    """ Number of halvings until a side is at most cutoff (at least min_depth),
+    and the sides padded to multiples of 2^depth.
+    """
+    depth, s = 0, min(m, k, n)
+    while s > cutoff:
+        s = (s + 1) // 2
+        depth += 1
+    depth = max(depth, min_depth)
+    q = 1 << depth
+    return depth, -(-m // q) * q, -(-k // q) * q, -(-n // q) * q
+
+
+def _levels(m, k, n, depth, dtype):
+    """ Temporaries S, T, P of each of depth halvings of an m x k by k x n product. """
+    return [(np.empty((m >> i, k >> i), dtype), np.empty((k >> i, n >> i), dtype), np.empty((m >> i, n >> i), dtype))
+            for i in range(1, depth + 1)]
+
+
+class StrassenWorkspace(object):
+    """ Arena of the buffers of a multiplication: the padded copies of A, B and C, and for
+    every level of the recursion the temporaries S (sum of A blocks), T (sum of B blocks)
+    and P (product). Reusing the workspace for the same shapes allocates nothing.
+    """
+
+    def __init__(self):
+        self.key = None
+
+    def get(self, m, k, n, cutoff, dtype, parallel_depth=0, n_arenas=1):
+        """
+        :param parallel_depth: number of top levels run by parallel_strassen, which have their own buffers
+        :param n_arenas: number of copies of the temporaries below parallel_depth, one per worker thread
+        :return: the padded buffers A, B, C (None if no padding is needed) and the arenas,
+            lists of (S, T, P) per level
+        """
+        key = (m, k, n, cutoff, np.dtype(dtype), parallel_depth, n_arenas)
+        if key != self.key:
+            depth, pm, pk, pn = _padded_shape(m, k, n, cutoff, parallel_depth)
+            self.padded = (None, None, None)
+            if (pm, pk, pn) != (m, k, n):
+                self.padded = (np.zeros((pm, pk), dtype), np.zeros((pk, pn), dtype), np.empty((pm, pn), dtype))
+            q = parallel_depth
+            self.arenas = [_levels(pm >> q, pk >> q, pn >> q, depth - q, dtype) for _ in range(n_arenas)]
+            self.key = key
+        return self.padded, self.arenas
+
+
+def _quadrants(M):
+    h, w = M.shape[0] // 2, M.shape[1] // 2
+    return M[:h, :w], M[:h, w:], M[h:, :w], M[h:, w:]
+
+
+def _strassen(A, B, C, levels, i):
+    """ C = A @ B with Strassen's 7 products, accumulated in the quadrants of C. """
+    if i == len(levels):
+        np.matmul(A, B, out=C)
+        return
+    S, T, P = levels[i]
+    A11, A12, A21, A22 = _quadrants(A)
+    B11, B12, B21, B22 = _quadrants(B)
+    C11, C12, C21, C22 = _quadrants(C)
+    np.subtract(B12, B22, out=T)
+    _strassen(A11, T, C12, levels, i + 1)          # C12 = P1
+    C22[:] = C12                                    # C22 = P1
+    np.add(A11, A12, out=S)
+    _strassen(S, B22, P, levels, i + 1)             # P2
+    C12 += P
+    np.negative(P, out=C11)
+    np.add(A21, A22, out=S)
+    _strassen(S, B11, C21, levels, i + 1)          # C21 = P3
+    C22 -= C21
+    np.subtract(B21, B11, out=T)
+    _strassen(A22, T, P, levels, i + 1)             # P4
+    C21 += P
+    C11 += P
+    np.add(A11, A22, out=S)
+    np.add(B11, B22, out=T)
+    _strassen(S, T, P, levels, i + 1)               # P5
+    C11 += P
+    C22 += P
+    np.subtract(A12, A22, out=S)
+    np.add(B21, B22, out=T)
+    _strassen(S, T, P, levels, i + 1)               # P6
+    C11 += P
+    np.subtract(A11, A21, out=S)
+    np.add(B11, B12, out=T)
+    _strassen(S, T, P, levels, i + 1)               # P7
+    C22 -= P
+
+
+def _simple(A, B, C, levels, i):
+    """ C = A @ B with the 8 products of the blocks. """
+    if i == len(levels):
+        np.matmul(A, B, out=C)
+        return
+    P = levels[i][2]
+    A11, A12, A21, A22 = _quadrants(A)
+    B11, B12, B21, B22 = _quadrants(B)
+    for Cij, (X, Y), (U, V) in zip(_quadrants(C), ((A11, B11), (A11, B12), (A21, B11), (A21, B12)),
+                                    ((A12, B21), (A12, B22), (A22, B21), (A22, B22))):
+        _simple(X, Y, Cij, levels, i + 1)
+        _simple(U, V, P, levels, i + 1)
+        Cij += P
+
+
+def _operands(A, B, cutoff):
+    A, B = np.asarray(A), np.asarray(B)
+    (m, k), (k2, n) = A.shape, B.shape
+    if k != k2:
+        raise ValueError(f"Shapes {A.shape} and {B.shape} are not aligned.")
+    cutoff = STRASSEN_CUTOFF if cutoff is None else cutoff
+    return A, B, m, k, n, cutoff, np.result_type(A, B)
+
+
+def _multiply(kernel, A, B, cutoff, workspace):
+    A, B, m, k, n, cutoff, dtype = _operands(A, B, cutoff)
+    (PA, PB, PC), (levels,) = (workspace or StrassenWorkspace()).get(m, k, n, cutoff, dtype)
+    if PA is None:
+        C = np.empty((m, n), dtype)
+        kernel(A.astype(dtype, copy=False), B.astype(dtype, copy=False), C, levels, 0)
+        return C
+    PA[:m, :k], PB[:k, :n] = A, B
+    kernel(PA, PB, PC, levels, 0)
+    return PC[:m, :n].copy()
+
+
+# Strassen's products P1..P7 as (terms of A, terms of B), a term being (quadrant, sign)
+# with the quadrants 11, 12, 21, 22 numbered 0..3.
+_PRODUCTS = (
+    (((0, 1),), ((1, 1), (3, -1))),         # P1 = A11 (B12 - B22)
+    (((0, 1), (1, 1)), ((3, 1),)),          # P2 = (A11 + A12) B22
+    (((2, 1), (3, 1)), ((0, 1),)),          # P3 = (A21 + A22) B11
+    (((3, 1),), ((2, 1), (0, -1))),         # P4 = A22 (B21 - B11)
+    (((0, 1), (3, 1)), ((0, 1), (3, 1))),   # P5 = (A11 + A22) (B11 + B22)
+    (((1, 1), (3, -1)), ((2, 1), (3, 1))),  # P6 = (A12 - A22) (B21 + B22)
+    (((0, 1), (2, -1)), ((0, 1), (1, 1))),  # P7 = (A11 - A21) (B11 + B12)
+)
+
+
+def _operand(Q, terms, alloc):
+    if len(terms) == 1:
+        return Q[terms[0][0]]
+    (i, _), (j, sign) = terms
+    out = alloc(Q[i].shape)
+    (np.add if sign > 0 else np.subtract)(Q[i], Q[j], out=out)
+    return out
+
+
+def _combine(P, C):
+    C11, C12, C21, C22 = _quadrants(C)
+    np.add(P[4], P[3], out=C11)
+    C11 -= P[1]
+    C11 += P[5]
+    np.add(P[0], P[1], out=C12)
+    np.add(P[2], P[3], out=C21)
+    np.add(P[0], P[4], out=C22)
+    C22 -= P[2]
+    C22 -= P[6]
+
+
+def _expand(A, B, C, depth, alloc, tasks, combines):
+    """ Unfolds depth levels of C = A @ B into the independent products of tasks, the
+    combinations of their results being appended to combines, innermost ones first.
+    """
+    if depth == 0:
+        tasks.append((A, B, C))
+        return
+    QA, QB = _quadrants(A), _quadrants(B)
+    P = [alloc((QA[0].shape[0], QB[0].shape[1])) for _ in range(7)]
+    for (terms_a, terms_b), Pj in zip(_PRODUCTS, P):
+        _expand(_operand(QA, terms_a, alloc), _operand(QB, terms_b, alloc), Pj, depth - 1, alloc, tasks, combines)
+    combines.append((P, C))
+
+
+# Shared memory and temporaries of the worker processes of parallel_strassen.
+_shared = {}
+
+
+def _init_worker(shm_name):
+    from multiprocessing import shared_memory
+    _shared['shm'] = shared_memory.SharedMemory(name=shm_name)
+
+
+def _product_in_worker(views, dtype, depth):
+    """ Runs a product of parallel_strassen on operands given as (offset, shape, strides) in shared memory. """
+    buf = _shared['shm'].buf
+    A, B, C = (np.ndarray(shape, dtype, buffer=buf, offset=offset, strides=strides)
+               for offset, shape, strides in views)
+    key = (A.shape, B.shape, dtype, depth)
+    if _shared.get('key') != key:
+        _shared['key'], _shared['levels'] = key, _levels(A.shape[0], A.shape[1], B.shape[1], depth, dtype)
+    _strassen(A, B, C, _shared['levels'], 0)
+    del A, B, C
+
+
+def _parallel_threads(A, B, m, k, n, cutoff, dtype, workspace, n_workers, parallel_depth):
+    import queue
+    from concurrent.futures import ThreadPoolExecutor
+
+    (PA, PB, PC), arenas = (workspace or StrassenWorkspace()).get(m, k, n, cutoff, dtype, parallel_depth, n_workers)
+    if PA is None:
+        PA, PB, PC = A.astype(dtype, copy=False), B.astype(dtype, copy=False), np.empty((m, n), dtype)
     else:
-        A11, A12, A21, A22 = A[:n//2, :n//2], A[:n//2, n//2:], A[n//2:, :n//2], A[n//2:, n//2:]
-        B11, B12, B21, B22 = B[:n//2, :n//2], B[:n//2, n//2:], B[n//2:, :n//2], B[n//2:, n//2:]
-        P1 = strassen(A11, B12 - B22)
-        P2 = strassen(A11 + A12, B22) 
-        P3 = strassen(A21 + A22, B11) 
-        P4 = strassen(A22, B21 - B11) 
-        P5 = strassen(A11 + A22, B11 + B22) 
-        P6 = strassen(A12 - A22, B21 + B22) 
-        P7 = strassen(A11 - A21, B11 + B12)
-        C11 = P5 + P4 - P2 + P6
-        C12 = P1 + P2
-        C21 = P3 + P4
-        C22 = P1 + P5 - P3 - P7
-        return np.vstack((np.hstack((C11, C12)), np.hstack((C21, C22))))
+        PA[:m, :k], PB[:k, :n] = A, B
+    tasks, combines = [], []
+    _expand(PA, PB, PC, parallel_depth, lambda shape: np.empty(shape, dtype), tasks, combines)
+    free = queue.Queue()
+    for arena in arenas:
+        free.put(arena)
+
+    def run(task):
+        arena = free.get()
+        try:
+            _strassen(*task, arena, 0)
+        finally:
+            free.put(arena)
+
+    with ThreadPoolExecutor(n_workers) as pool:
+        list(pool.map(run, tasks))
+    for P, C in combines:
+        _combine(P, C)
+    return PC[:m, :n].copy() if PC.shape != (m, n) else PC
+
+
+def _parallel_processes(shm, A, B, m, k, n, cutoff, dtype, n_workers, parallel_depth):
+    from concurrent.futures import ProcessPoolExecutor
+
+    depth, pm, pk, pn = _padded_shape(m, k, n, cutoff, parallel_depth)
+    base = np.frombuffer(shm.buf, np.uint8).__array_interface__['data'][0]
+    offset = [0]
+
+    def alloc(shape):
+        a = np.ndarray(shape, dtype, buffer=shm.buf, offset=offset[0])
+        offset[0] += a.nbytes
+        return a
+
+    def view(a):
+        return a.__array_interface__['data'][0] - base, a.shape, a.strides
+
+    PA, PB, PC = alloc((pm, pk)), alloc((pk, pn)), alloc((pm, pn))
+    PA[:m, :k], PB[:k, :n] = A, B
+    tasks, combines = [], []
+    _expand(PA, PB, PC, parallel_depth, alloc, tasks, combines)
+    with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(shm.name,)) as pool:
+        futures = [pool.submit(_product_in_worker, [view(a) for a in task], dtype, depth - parallel_depth)
+                   for task in tasks]
+        for future in futures:
+            future.result()
+    for P, C in combines:
+        _combine(P, C)
+    return PC[:m, :n].copy()
+
+
+def parallel_strassen(A, B, cutoff=None, workspace=None, n_workers=None, parallel_depth=1, processes=False):
+    """ Strassen multiplication with the 7 products of the top levels computed in parallel:
+    the parallel_depth top levels are unfolded into 7^parallel_depth independent products,
+    each one done by the sequential strassen on a thread (NumPy releases the GIL in BLAS)
+    or on a process working on shared memory, then the results are combined.
+    :param A: m x k matrix
+    :param B: k x n matrix
+    :param cutoff: largest block side multiplied by BLAS, default is STRASSEN_CUTOFF
+    :param workspace: StrassenWorkspace to reuse between calls (threads only)
+    :param n_workers: number of workers, default is the number of CPUs
+    :param parallel_depth: number of levels unfolded, usually 1 or 2
+    :param processes: use a process pool instead of a thread pool
+    :return: A @ B
+    """
+    import os
+
+    A, B, m, k, n, cutoff, dtype = _operands(A, B, cutoff)
+    n_workers = n_workers or os.cpu_count()
+    if not processes:
+        return _parallel_threads(A, B, m, k, n, cutoff, dtype, workspace, n_workers, parallel_depth)
+    from multiprocessing import shared_memory
+    _, pm, pk, pn = _padded_shape(m, k, n, cutoff, parallel_depth)
+    nbytes = pm * pk + pk * pn + pm * pn
+    for level in range(1, parallel_depth + 1):
+        hm, hk, hn = pm >> level, pk >> level, pn >> level
+        nbytes += 7 ** level * (hm * hk + hk * hn + hm * hn)
+    shm = shared_memory.SharedMemory(create=True, size=max(nbytes * np.dtype(dtype).itemsize, 1))
+    try:
+        return _parallel_processes(shm, A, B, m, k, n, cutoff, dtype, n_workers, parallel_depth)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def simple_divide_and_conquer(A, B, cutoff=None, workspace=None):
+    """ Block multiplication with 8 recursive products, down to blocks of side cutoff
+    (default STRASSEN_CUTOFF) that are multiplied by BLAS.
+    """
+    return _multiply(_simple, A, B, cutoff, workspace)
+
+
+def strassen(A, B, cutoff=None, workspace=None):
+    """ Hybrid Strassen multiplication of matrices of any shapes.
+    The sides are zero-padded to multiples of 2^depth, where depth is the number of halvings
+    until a block side is at most cutoff (default STRASSEN_CUTOFF), below which BLAS is used.
+    :param A: m x k matrix
+    :param B: k x n matrix
+    :param cutoff: largest block side multiplied by BLAS
+    :param workspace: StrassenWorkspace to reuse between calls
+    :return: A @ B
+    """
+    return _multiply(_strassen, A, B, cutoff, workspace)
 
 
 def test_simple_divide_and_conquer():
@@ -43,6 +319,7 @@ def test_simple_divide_and_conquer():
             A = np.random.randint(0, 10, (n, n))
             B = np.random.randint(0, 10, (n, n))
             assert np.allclose(simple_divide_and_conquer(A, B), A@B)
+            assert np.array_equal(simple_divide_and_conquer(A, B, cutoff=1), A@B)
     print("[test_simple_divide_and_conquer] Passed.")
 
 
@@ -53,9 +330,71 @@ def test_strassen():
             A = np.random.randint(0, 10, (n, n))
             B = np.random.randint(0, 10, (n, n))
             assert np.allclose(strassen(A, B), A@B)
+            assert np.array_equal(strassen(A, B, cutoff=1), A@B)
+    workspace = StrassenWorkspace()
+    for _ in range(50):
+        m, k, n = np.random.randint(1, 70, 3)
+        A = np.random.randint(-10, 10, (m, k))
+        B = np.random.randint(-10, 10, (k, n))
+        assert np.array_equal(strassen(A, B, cutoff=np.random.randint(1, 20), workspace=workspace), A@B)
+        A, B = np.random.rand(m, k), np.random.rand(k, n)
+        assert np.allclose(strassen(A, B, cutoff=8), A@B)
     print("[test_strassen] Passed.")
 
 
+def test_parallel_strassen():
+    workspace = StrassenWorkspace()
+    for _ in range(10):
+        m, k, n = np.random.randint(1, 70, 3)
+        A = np.random.randint(-10, 10, (m, k))
+        B = np.random.randint(-10, 10, (k, n))
+        for depth in (1, 2):
+            assert np.array_equal(parallel_strassen(A, B, 4, workspace, 3, depth), A@B)
+            assert np.array_equal(parallel_strassen(A, B, 4, n_workers=2, parallel_depth=depth, processes=True), A@B)
+    print("[test_parallel_strassen] Passed.")
+
+
+def _time(f, repeat):
+    import time
+    f()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        f()
+    return (time.perf_counter() - start) / repeat
+
+
+def tune_cutoff(n=1024, candidates=(32, 64, 128, 256, 512), repeat=3):
+    """ Cutoff with the fastest strassen for n x n matrices on this machine;
+    assign it to STRASSEN_CUTOFF to make it the default.
+    """
+    A, B = np.random.rand(n, n), np.random.rand(n, n)
+    workspace = StrassenWorkspace()
+    times = {c: _time(lambda: strassen(A, B, c, workspace), repeat) for c in candidates}
+    return min(times, key=times.get)
+
+
+def benchmark(shapes=((512, 512, 512), (1000, 1000, 1000), (2048, 2048, 2048), (3000, 1000, 2000)),
+              cutoff=None, repeat=3):
+    """ Compare strassen (with a reused workspace) and A @ B. """
+    for m, k, n in shapes:
+        A, B = np.random.rand(m, k), np.random.rand(k, n)
+        workspace = StrassenWorkspace()
+        t_strassen = _time(lambda: strassen(A, B, cutoff, workspace), repeat)
+        t_blas = _time(lambda: A @ B, repeat)
+        print(f"[benchmark] {m}x{k} @ {k}x{n}: strassen {t_strassen:.3f}s, A @ B {t_blas:.3f}s")
+
+
+def benchmark_parallel(n=4096, workers=(1, 2, 4, 8, 16), parallel_depth=1, processes=False, cutoff=None):
+    """ Speed-up of parallel_strassen over the sequential strassen on n x n matrices. """
+    A, B = np.random.rand(n, n), np.random.rand(n, n)
+    t_seq = _time(lambda: strassen(A, B, cutoff), 1)
+    print(f"[benchmark_parallel] n = {n}: strassen {t_seq:.2f}s")
+    for w in workers:
+        workspace = StrassenWorkspace()
+        t = _time(lambda: parallel_strassen(A, B, cutoff, workspace, w, parallel_depth, processes), 1)
+        print(f"[benchmark_parallel] {w} workers: {t:.2f}s, speed-up {t_seq / t:.2f}")
+
+
 if __name__ == '__main__':
     A = np.array([[1, 2], [3, 4]])
     B = np.array([[5, 6], [7, 8]])
@@ -1,28 +1,30 @@
+import numpy as np
+
+
 def knapsack_value(w, v, C):
-    """
+    """ Maximum value, computed by knapsack_value_vec.
     :param w: list of weights
     :param v: list of values
     :param C: capacity
     :return: maximum value
     """
-    n = len(w)
-    f = [[0 for _ in range(C+1)] for _ in range(n+1)]
-    for i in range(1, n+1):
-        for s in range(1, C+1):
-            if w[i-1] > s:
-                f[i][s] = f[i-1][s]
-            else:
-                f[i][s] = max(f[i-1][s], f[i-1][s-w[i-1]] + v[i-1])
-    return f[n][C]
+    return knapsack_value_vec(w, v, C)
 
 
 def knapsack(w, v, C):
-    """
+    """ Knapsack solved by knapsack_vec.
     :param w: list of weights
     :param v: list of values
     :param C: capacity
     :return: total value, list of items (indices)
     """
+    return knapsack_vec(w, v, C)
+
+
+def _knapsack_table(w, v, C):
+    """ The textbook DP with the full (n+1) x (C+1) table, the reference of the tests.
+    :return: total value, list of items (indices)
+    """
     n = len(w)
     f = [[0 for _ in range(C+1)] for _ in range(n+1)]
     for i in range(1, n+1):
@@ -43,12 +45,435 @@ def knapsack(w, v, C):
     return f[n][C], packed_items
 
 
+def _add_item(f, w, v):
+    """ Adds an item to the rolling array f (in place), where f[s] is the maximum value
+    with total weight at most s. Returns the boolean decisions (taking the item at s + w).
+    """
+    if w >= len(f):
+        return np.zeros(0, dtype=bool)
+    take = f[:len(f) - w] + v
+    better = take > f[w:]
+    np.maximum(f[w:], take, out=f[w:])
+    return better
+
+
+def _value_dtype(v):
+    """ dtype of the rolling arrays: the dtype of the values promoted with int64. """
+    return np.promote_types(np.asarray(v).dtype, np.int64) if len(v) else np.dtype(np.int64)
+
+
+def knapsack_value_vec(w, v, C):
+    """ Vectorized knapsack_value, with one rolling array of length C+1.
+    :param w: list of weights
+    :param v: list of values
+    :param C: capacity
+    :return: maximum value
+    """
+    f = np.zeros(C + 1, dtype=_value_dtype(v))
+    for i in range(len(w)):
+        _add_item(f, w[i], v[i])
+    return f[C].item()
+
+
+def _knapsack_bits(w, v, items, C, dtype):
+    """ Solves the knapsack restricted to items, storing one bit per (item, capacity).
+    :return: maximum value, list of packed items
+    """
+    f = np.zeros(C + 1, dtype=dtype)
+    bits = []
+    for i in items:
+        bits.append((w[i], np.packbits(_add_item(f, w[i], v[i]))))
+    packed_items = []
+    s = C
+    for i, (wi, b) in zip(reversed(items), reversed(bits)):
+        # bit s - wi says whether item i is taken at capacity s
+        if s >= wi and (b[(s - wi) >> 3] >> (7 - ((s - wi) & 7))) & 1:
+            packed_items.append(i)
+            s -= wi
+    packed_items.reverse()
+    return f[C].item(), packed_items
+
+
+def _knapsack_divide(w, v, items, C, max_bits, dtype):
+    """ Hirschberg-style reconstruction: split the items in halves, find the split of the
+    capacity from the two rolling arrays, and solve the halves separately.
+    """
+    if len(items) * (C + 1) <= max_bits or len(items) == 1:
+        return _knapsack_bits(w, v, items, C, dtype)[1]
+    left, right = items[:len(items) // 2], items[len(items) // 2:]
+    f = np.zeros(C + 1, dtype=dtype)
+    for i in left:
+        _add_item(f, w[i], v[i])
+    g = np.zeros(C + 1, dtype=dtype)
+    for i in right:
+        _add_item(g, w[i], v[i])
+    c = int(np.argmax(f + g[::-1]))  # f[c] + g[C - c]
+    return (_knapsack_divide(w, v, left, c, max_bits, dtype) +
+            _knapsack_divide(w, v, right, C - c, max_bits, dtype))
+
+
+def knapsack_vec(w, v, C, max_bytes=1 << 28):
+    """ Vectorized knapsack with O(C) value memory.
+    The items are reconstructed from a bit-packed decision matrix if it fits in max_bytes,
+    otherwise by divide and conquer on the items.
+    :param w: list of weights
+    :param v: list of values
+    :param C: capacity
+    :param max_bytes: memory budget of the decision bits
+    :return: total value, list of items (indices)
+    """
+    items = list(range(len(w)))
+    dtype = _value_dtype(v)
+    if len(w) * (C + 1) <= 8 * max_bytes:
+        return _knapsack_bits(w, v, items, C, dtype)
+    packed_items = _knapsack_divide(w, v, items, C, 8 * max_bytes, dtype)
+    return sum(v[i] for i in packed_items), packed_items
+
+
+def _lp_bounds(ws, vs, start, room, P_w, P_v):
+    """ LP bounds of the items start, start+1, ... (in the order of v/w) for each capacity in room.
+    P_w and P_v are the prefix sums of ws and vs.
+    """
+    n = len(ws)
+    j = np.searchsorted(P_w, P_w[start] + room, side='right') - 1
+    bound = (P_v[j] - P_v[start]).astype(float)
+    partial = j < n
+    jp = j[partial]
+    bound[partial] += (P_w[start] + room[partial] - P_w[jp]) * (vs[jp] / ws[jp])
+    return bound
+
+
+def knapsack_sparse(w, v, C):
+    """ Sparse knapsack: only the Pareto-optimal (weight, value) states are kept, in arrays sorted
+    by weight. The items are added in the order of v/w (as in the greedy algorithm), and a state is
+    dropped if its value plus the LP bound of the remaining items is below the greedy value.
+    Works for any nonnegative weights and values, and does not depend on the size of C.
+    :param w: list of weights
+    :param v: list of values
+    :param C: capacity
+    :return: total value, list of items (indices)
+    """
+    order = [i for i in range(len(w)) if w[i] <= C and v[i] > 0]
+    order.sort(key=lambda i: v[i] / w[i] if w[i] > 0 else np.inf, reverse=True)
+    if not order:
+        return 0, []
+    ws = np.array([w[i] for i in order])
+    vs = np.array([v[i] for i in order])
+    P_w = np.concatenate(([0], np.cumsum(ws)))
+    P_v = np.concatenate(([0], np.cumsum(vs)))
+    # Greedy lower bound.
+    lower, room = 0, C
+    for wi, vi in zip(ws.tolist(), vs.tolist()):
+        if wi <= room:
+            lower += vi
+            room -= wi
+    tol = 1e-9 * max(1, abs(lower))
+
+    W = np.zeros(1, dtype=ws.dtype)
+    V = np.zeros(1, dtype=vs.dtype)
+    history = []  # per item: parent of each state in the previous front, whether the item is taken
+    for k in range(len(order)):
+        cut = np.searchsorted(W, C - ws[k], side='right')
+        # Linear merge of the two fronts by weight.
+        m = len(W) + cut
+        taken = np.zeros(m, dtype=bool)
+        taken[np.searchsorted(W, W[:cut] + ws[k], side='right') + np.arange(cut)] = True
+        Wm = np.empty(m, dtype=W.dtype)
+        Vm = np.empty(m, dtype=V.dtype)
+        parent = np.empty(m, dtype=np.int64)
+        Wm[~taken], Vm[~taken], parent[~taken] = W, V, np.arange(len(W))
+        Wm[taken], Vm[taken], parent[taken] = W[:cut] + ws[k], V[:cut] + vs[k], np.arange(cut)
+        # Pareto filter: the value must increase with the weight.
+        keep = np.ones(m, dtype=bool)
+        keep[1:] = Vm[1:] > np.maximum.accumulate(Vm)[:-1]
+        idx = np.flatnonzero(keep)
+        idx = idx[np.append(Wm[idx[1:]] > Wm[idx[:-1]], True)]
+        # Bound: drop the states that cannot reach the greedy value.
+        lower = max(lower, Vm[idx[-1]])
+        idx = idx[Vm[idx] + _lp_bounds(ws, vs, k + 1, C - Wm[idx], P_w, P_v) >= lower - tol]
+        W, V = Wm[idx], Vm[idx]
+        history.append((parent[idx], taken[idx]))
+
+    best = int(np.argmax(V))
+    value = V[best].item()
+    packed_items = []
+    for k in reversed(range(len(order))):
+        parent, taken = history[k]
+        if taken[best]:
+            packed_items.append(order[k])
+        best = parent[best]
+    packed_items.sort()
+    return value, packed_items
+
+
+# Relative cost of a sparse state compared to a dense cell, for knapsack_auto.
+SPARSE_COST = 16
+
+
+def knapsack_auto(w, v, C):
+    """ Chooses between knapsack_vec and knapsack_sparse from the estimated number of states.
+    The dense engine has C+1 states per item; the Pareto front has at most
+    min(2^i, C+1, sum(v)+1) states after i items.
+    :param w: list of weights
+    :param v: list of values
+    :param C: capacity
+    :return: total value, list of items (indices)
+    """
+    integral = all(isinstance(x, (int, np.integer)) for x in list(w) + [C])
+    if not integral:
+        return knapsack_sparse(w, v, C)
+    states = min(2 ** min(len(w), 64), C + 1)
+    if all(isinstance(x, (int, np.integer)) for x in v):
+        states = min(states, sum(v) + 1)
+    if SPARSE_COST * states < C + 1:
+        return knapsack_sparse(w, v, C)
+    return knapsack_vec(w, v, C)
+
+
+class IncrementalKnapsack(object):
+    """ Knapsack over a changing set of items, answering queries for any capacity up to C.
+    The items form a queue stored as two stacks, each with the rolling arrays (see _add_item)
+    of its prefixes: tables[k][s] is the maximum value of the first k items of the stack with
+    weight at most s. Adding an item pushes one array, O(C). Removing the oldest item, by its
+    key or with key None, pops one, after moving the back stack to the front one when that is
+    empty, O(C) amortized. Removing any other item recomputes the arrays above it in its stack,
+    O(d*C) at depth d, and the arrays take O(n*C) memory: if the sequence of operations is known
+    in advance, knapsack_offline does any removal in O(C log n) time and memory.
+    A query combines the tops of the two stacks in O(C).
+    """
+
+    def __init__(self, C, w=(), v=(), dtype=np.int64):
+        """
+        :param C: maximum capacity
+        :param w: list of weights of the initial items
+        :param v: list of values of the initial items
+        :param dtype: dtype of the values
+        """
+        self.C = C
+        self._dtype = dtype
+        self._next_key = 0
+        # Items as (key, weight, value); the oldest item is on top of the front stack.
+        self._front, self._front_tables = [], [np.zeros(C + 1, dtype=dtype)]
+        self._back, self._back_tables = [], [np.zeros(C + 1, dtype=dtype)]
+        for i in range(len(w)):
+            self.add_item(w[i], v[i])
+
+    def __len__(self):
+        return len(self._front) + len(self._back)
+
+    @staticmethod
+    def _push(stack, tables, item):
+        f = tables[-1].copy()
+        _add_item(f, item[1], item[2])
+        stack.append(item)
+        tables.append(f)
+
+    def add_item(self, w, v):
+        """ Adds an item and returns its key. """
+        key = self._next_key
+        self._next_key += 1
+        self._push(self._back, self._back_tables, (key, w, v))
+        return key
+
+    def remove_item(self, key=None):
+        """ Removes the item with the given key, or the oldest item if key is None. """
+        oldest = self._front[-1] if self._front else self._back[0] if self._back else None
+        if key is None or oldest is not None and key == oldest[0]:
+            if oldest is None:
+                raise KeyError(key)
+            if not self._front:
+                # Move the back stack to the front, the oldest item on top.
+                items = self._back[::-1]
+                del self._back[:], self._back_tables[1:]
+                for item in items:
+                    self._push(self._front, self._front_tables, item)
+            del self._front[-1], self._front_tables[-1]
+            return
+        for stack, tables in ((self._front, self._front_tables), (self._back, self._back_tables)):
+            for d in range(len(stack) - 1, -1, -1):
+                if stack[d][0] == key:
+                    above = stack[d + 1:]
+                    del stack[d:], tables[d + 1:]
+                    for item in above:
+                        self._push(stack, tables, item)
+                    return
+        raise KeyError(key)
+
+    def _split(self, C):
+        front, back = self._front_tables[-1], self._back_tables[-1]
+        total = front[:C + 1] + back[C::-1]
+        s = int(np.argmax(total))
+        return total[s].item(), s
+
+    def value(self, C=None):
+        """ Maximum value with capacity C (default the maximum capacity). """
+        C = self.C if C is None else C
+        return self._split(C)[0]
+
+    def knapsack(self, C=None):
+        """ Same return contract as knapsack: total value, keys of the packed items. """
+        C = self.C if C is None else C
+        value, s = self._split(C)
+        packed_items = []
+        for stack, tables, room in ((self._front, self._front_tables, s),
+                                    (self._back, self._back_tables, C - s)):
+            for k in range(len(stack), 0, -1):
+                if tables[k][room] != tables[k - 1][room]:
+                    packed_items.append(stack[k - 1][0])
+                    room -= stack[k - 1][1]
+        return value, sorted(packed_items)
+
+
+def knapsack_offline(C, operations, dtype=None):
+    """ Knapsack over a changing set of items, with all the operations known in advance.
+    Every item is alive during an interval of the queries; the interval is split over the
+    O(log q) nodes of a segment tree on the q queries that cover it, and a depth-first walk
+    of the tree adds the items of a node to a copy of its parent's rolling array (see _add_item),
+    answering the queries at the leaves. Every add or remove costs O(C log q) time, and the
+    walk keeps one array per level, O(C log q) memory.
+    :param C: maximum capacity
+    :param operations: sequence of ('add', w, v), ('remove', key) and ('query', c) (or ('query',)
+        for the capacity C), the keys of the items numbered 0, 1, ... in the order of the adds,
+        as the ones of IncrementalKnapsack
+    :param dtype: dtype of the values, default is the dtype of the values added promoted with int64
+    :return: list of the maximum values of the queries
+    """
+    items, start, end, capacities = [], [], [], []
+    q = 0
+    for op in operations:
+        if op[0] == 'add':
+            items.append((op[1], op[2]))
+            start.append(q)
+            end.append(None)
+        elif op[0] == 'remove':
+            end[op[1]] = q
+        elif op[0] == 'query':
+            capacities.append(op[1] if len(op) > 1 else C)
+            q += 1
+        else:
+            raise ValueError(f"Unknown operation {op[0]}.")
+    if q == 0:
+        return []
+    # Items of the nodes of the segment tree on [0, q); node k has children 2k+1, 2k+2.
+    nodes = {}
+
+    def insert(k, lo, hi, a, b, item):
+        if b <= lo or hi <= a:
+            return
+        if a <= lo and hi <= b:
+            nodes.setdefault(k, []).append(item)
+            return
+        mid = (lo + hi) // 2
+        insert(2 * k + 1, lo, mid, a, b, item)
+        insert(2 * k + 2, mid, hi, a, b, item)
+
+    for i, item in enumerate(items):
+        b = q if end[i] is None else end[i]
+        if start[i] < b:
+            insert(0, 0, q, start[i], b, item)
+    res = [0] * q
+
+    def walk(k, lo, hi, f):
+        for wi, vi in nodes.get(k, ()):
+            _add_item(f, wi, vi)
+        if hi - lo == 1:
+            res[lo] = f[min(capacities[lo], C)].item()
+            return
+        mid = (lo + hi) // 2
+        walk(2 * k + 1, lo, mid, f.copy())
+        walk(2 * k + 2, mid, hi, f)
+
+    if dtype is None:
+        dtype = np.promote_types(np.asarray([vi for _, vi in items]).dtype if items else np.int64, np.int64)
+    walk(0, 0, q, np.zeros(C + 1, dtype=dtype))
+    return res
+
+
 def print_items(items, w, v):
     print('Item Indices:', items)
     print('Total weight:', sum([w[i] for i in items]))
     print('Total value:', sum([v[i] for i in items]))
 
 
+def test_knapsack_vec():
+    for _ in range(100):
+        n = np.random.randint(1, 15)
+        w = np.random.randint(1, 30, n).tolist()
+        v = np.random.randint(0, 100, n).tolist()
+        C = np.random.randint(0, 100)
+        value, _ = _knapsack_table(w, v, C)
+        assert knapsack_value_vec(w, v, C) == knapsack_value(w, v, C) == value
+        total, items = knapsack(w, v, C)
+        assert total == value == sum(v[i] for i in items) and sum(w[i] for i in items) <= C
+        for max_bytes in (1 << 20, 1):
+            total, items = knapsack_vec(w, v, C, max_bytes)
+            assert total == value == sum(v[i] for i in items)
+            assert sum(w[i] for i in items) <= C and len(set(items)) == len(items)
+    # Thousands of items, float values.
+    w, v = np.random.randint(1, 50, 3000).tolist(), (np.random.rand(3000) * 10).tolist()
+    total, items = knapsack_vec(w, v, 500)
+    assert np.isclose(total, knapsack_value_vec(w, v, 500)) and np.isclose(total, sum(v[i] for i in items))
+    print('[test_knapsack_vec] Passed.')
+
+
+def test_knapsack_sparse():
+    for _ in range(100):
+        n = np.random.randint(1, 15)
+        w = np.random.randint(1, 30, n).tolist()
+        v = np.random.randint(0, 100, n).tolist()
+        C = np.random.randint(0, 100)
+        value, _ = _knapsack_table(w, v, C)
+        for total, items in (knapsack_sparse(w, v, C), knapsack_auto(w, v, C)):
+            assert total == value == sum(v[i] for i in items)
+            assert sum(w[i] for i in items) <= C and len(set(items)) == len(items)
+    print('[test_knapsack_sparse] Passed.')
+
+
+def test_incremental_knapsack():
+    C = 60
+    ks = IncrementalKnapsack(C)
+    items = {}
+    for _ in range(300):
+        if items and np.random.rand() < 0.4:
+            key = np.random.choice(list(items)) if np.random.rand() < 0.5 else min(items)
+            ks.remove_item(key if key != min(items) else None)
+            del items[key]
+        else:
+            wi, vi = np.random.randint(1, 30), np.random.randint(0, 100)
+            items[ks.add_item(wi, vi)] = (wi, vi)
+        keys = list(items)
+        w, v = [items[k][0] for k in keys], [items[k][1] for k in keys]
+        c = np.random.randint(0, C + 1)
+        best, _ = _knapsack_table(w, v, c)
+        assert ks.value(c) == best
+        value, packed = ks.knapsack(c)
+        assert value == best == sum(items[k][1] for k in packed)
+        assert sum(items[k][0] for k in packed) <= c
+    # The same operations, offline.
+    ks = IncrementalKnapsack(C)
+    operations, expected, keys = [], [], []
+    for _ in range(300):
+        r = np.random.rand()
+        if keys and r < 0.3:
+            key = keys.pop(np.random.randint(len(keys)) if r < 0.15 else 0)
+            ks.remove_item(key)
+            operations.append(('remove', key))
+        elif r < 0.7:
+            wi, vi = np.random.randint(1, 30), np.random.randint(0, 100)
+            keys.append(ks.add_item(wi, vi))
+            operations.append(('add', wi, vi))
+        else:
+            c = np.random.randint(0, C + 1)
+            expected.append(ks.value(c))
+            operations.append(('query', c))
+    assert knapsack_offline(C, operations) == expected
+    assert knapsack_offline(C, iter(operations), dtype=float) == expected
+    ks = IncrementalKnapsack(10, dtype=float)
+    ks.add_item(3, 2.5)
+    assert knapsack_offline(10, [('add', 3, 2.5), ('query',)]) == [ks.value()] == [2.5]
+    print('[test_incremental_knapsack] Passed.')
+
+
 if __name__ == '__main__':
     w = [23, 26, 20, 18, 32, 27, 29, 26, 30, 27]
     v = [505, 352, 458, 220, 354, 414, 498, 545, 473, 543]
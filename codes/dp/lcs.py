@@ -1,3 +1,12 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+
 def lcs_length(X, Y):
     """ Returns the **length** of the LCS of X and Y.
     """
@@ -6,7 +15,7 @@ def lcs_length(X, Y):
     c = [[0] * (n + 1) for _ in range(m + 1)]
     for i in range(1, m + 1):
         for j in range(1, n + 1):
-            if X[-1] == Y[-1]:
+            if X[i - 1] == Y[j - 1]:
                 c[i][j] = c[i - 1][j - 1] + 1
             else:
                 c[i][j] = max(c[i - 1][j], c[i][j - 1])
@@ -53,13 +62,282 @@ def get_lcs(b, X, i, j, res):
         get_lcs(b, X, i, j - 1, res)
 
 
+def traceback_lcs(b, X, i, j):
+    """ Same as get_lcs, but with a loop instead of the recursion.
+    """
+    res = []
+    while i > 0 and j > 0:
+        if b[i][j] == 1:
+            res.append(X[i - 1])
+            i, j = i - 1, j - 1
+        elif b[i][j] == 2:
+            i -= 1
+        else:
+            j -= 1
+    res.reverse()
+    return res
+
+
+def match_masks(X, Y):
+    """ Returns a dict mapping each symbol of X that occurs in Y to a bit mask,
+    where bit j is set if Y[j] is the symbol.
+    """
+    wanted = set(X)
+    positions = {}
+    for j, y in enumerate(Y):
+        if y in wanted:
+            positions.setdefault(y, []).append(j)
+    n_bytes = (len(Y) + 7) // 8
+    masks = {}
+    for y, p in positions.items():
+        if len(p) == 1:
+            masks[y] = 1 << p[0]
+            continue
+        p = np.array(p)
+        buf = np.zeros(n_bytes, dtype=np.uint8)
+        np.bitwise_or.at(buf, p >> 3, (1 << (p & 7)).astype(np.uint8))
+        masks[y] = int.from_bytes(buf.tobytes(), 'little')
+    return masks
+
+
+def lcs_bits(X, Y, masks=None):
+    """ Bit-parallel LCS (Allison-Dix, Hyyro): scans X once and keeps one bit per symbol of Y.
+    Returns the bit vector V; the number of zeros among the lowest j bits of V
+    is the length of the LCS of X and Y[:j].
+    masks may be given to reuse match_masks(Z, Y) for any Z containing the symbols of X.
+    """
+    n = len(Y)
+    if masks is None:
+        masks = match_masks(X, Y)
+    full = (1 << n) - 1
+    V = full
+    for x in X:
+        U = V & masks.get(x, 0)
+        if U:
+            V = ((V + U) | (V - U)) & full
+    return V
+
+
+def lcs_length_bits(X, Y):
+    """ Returns the length of the LCS of X and Y in O(len(X) * len(Y) / wordsize) time
+    and O(min(len(X), len(Y)) / wordsize) memory.
+    """
+    if len(X) < len(Y):
+        X, Y = Y, X
+    return len(Y) - lcs_bits(X, Y).bit_count()
+
+
+def lcs_row(X, Y):
+    """ Returns the array r with r[j] = length of the LCS of X and Y[:j], j = 0, ..., len(Y).
+    """
+    n = len(Y)
+    V = lcs_bits(X, Y)
+    bits = np.unpackbits(np.frombuffer(V.to_bytes((n + 7) // 8, 'little'), dtype=np.uint8),
+                         bitorder='little')[:n]
+    return np.concatenate(([0], np.cumsum(1 - bits.astype(np.int64))))
+
+
+# Above this number of cells, LCS switches from the b table to the bit-parallel Hirschberg method.
+LCS_TABLE_CELLS = 1 << 15
+
+
+def lcs_hirschberg(X, Y):
+    """ Returns the LCS of X and Y (as a list) with Hirschberg's divide and conquer in linear space.
+    An explicit stack replaces the recursion, and the small subproblems use the b table.
+    """
+    res = []
+    stack = [(0, len(X), 0, len(Y))]
+    while stack:
+        i0, i1, j0, j1 = stack.pop()
+        x, y = X[i0:i1], Y[j0:j1]
+        if len(x) == 0 or len(y) == 0:
+            continue
+        if len(x) == 1:
+            if x[0] in y:
+                res.append(x[0])
+            continue
+        if (len(x) + 1) * (len(y) + 1) <= LCS_TABLE_CELLS:
+            _, b = lcs_length_b(x, y)
+            res += traceback_lcs(b, x, len(x), len(y))
+            continue
+        # Split Y where the LCS of the top half of X ends.
+        mid = (i0 + i1) // 2
+        top = lcs_row(X[i0:mid], y)
+        bottom = lcs_row(X[mid:i1][::-1], y[::-1])
+        k = int(np.argmax(top + bottom[::-1]))
+        # The left part is pushed last, so that it is solved first.
+        stack.append((mid, i1, j0 + k, j1))
+        stack.append((i0, mid, j0, j0 + k))
+    return res
+
+
 def LCS(X, Y):
     """ Returns the LCS of X and Y.
+    Small inputs use the b table, large ones the bit-parallel Hirschberg method.
     """
-    _, b = lcs_length_b(X, Y)
-    res = []
-    get_lcs(b, X, len(X), len(Y), res)
-    return "".join(res)
+    if (len(X) + 1) * (len(Y) + 1) <= LCS_TABLE_CELLS:
+        _, b = lcs_length_b(X, Y)
+        res = traceback_lcs(b, X, len(X), len(Y))
+    else:
+        res = lcs_hirschberg(X, Y)
+    return "".join(res) if isinstance(X, str) else res
+
+
+class LCSCache(object):
+    """ LRU cache of LCS lengths, keyed on the digests of the two sequences.
+    """
+
+    def __init__(self, maxsize=1 << 20):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    @staticmethod
+    def digest(X):
+        """ Digest of the whole content of X: the bytes of a string, of the dtype and data of
+        a sequence of numbers or strings, and of its pickle otherwise.
+        """
+        if isinstance(X, str):
+            data = b's' + X.encode()
+        elif isinstance(X, bytes):
+            data = b'b' + X
+        else:
+            a = np.asarray(X)
+            if a.dtype == object or a.ndim != 1:
+                data = b'p' + pickle.dumps(tuple(X))
+            else:
+                data = b'a' + a.dtype.str.encode() + b':' + a.tobytes()
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def get(self, ka, kb):
+        key = (ka, kb) if ka <= kb else (kb, ka)  # the LCS is symmetric
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, ka, kb, value):
+        key = (ka, kb) if ka <= kb else (kb, ka)
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+def lcs_lengths_row(a, bs):
+    """ Returns the LCS lengths of a and each sequence of bs.
+    The bit masks of a are built once and reused for the whole row.
+    """
+    masks = match_masks(a, a)
+    return [len(a) - lcs_bits(b, a, masks).bit_count() for b in bs]
+
+
+# Column sequences of lcs_matrix, sent once to each worker process.
+_columns = []
+
+
+def _init_worker(columns):
+    _columns[:] = columns
+
+
+def _lcs_block(rows):
+    """ Computes a block of rows of lcs_matrix in a worker process. """
+    return [lcs_lengths_row(a, [_columns[j] for j in js]) for a, js in rows]
+
+
+def lcs_matrix(A, B, similarity=False, cache=None, n_workers=None, block=16):
+    """ Returns the matrix of the LCS lengths of every a in A and b in B,
+    or of the similarities 2 * LCS(a, b) / (len(a) + len(b)) if similarity is True.
+    :param cache: LCSCache of the pairs already computed, updated with the new pairs
+    :param n_workers: number of worker processes for the rows, default is the number of CPUs
+    :param block: number of rows sent to a worker at once
+    """
+    A, B = list(A), list(B)
+    ka = [LCSCache.digest(a) for a in A]
+    kb = [LCSCache.digest(b) for b in B]
+    # Compute each distinct pair once.
+    ua = list(dict.fromkeys(ka))
+    ub = list(dict.fromkeys(kb))
+    seq = dict(zip(ka, A))
+    seq.update(zip(kb, B))
+    col = {k: j for j, k in enumerate(ub)}
+    values = {}
+    rows = []
+    for k in ua:
+        js = []
+        for kc in ub:
+            value = None if cache is None else cache.get(k, kc)
+            if value is None:
+                js.append(col[kc])
+            else:
+                values[k, kc] = value
+        if js:
+            rows.append((k, js))
+
+    columns = [seq[k] for k in ub]
+    blocks = [rows[i: i + block] for i in range(0, len(rows), block)]
+    tasks = [[(seq[k], js) for k, js in rows_block] for rows_block in blocks]
+    n_workers = n_workers or os.cpu_count()
+    if n_workers == 1 or len(tasks) <= 1:
+        _init_worker(columns)
+        results = list(map(_lcs_block, tasks))
+    else:
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(columns,)) as pool:
+            results = list(pool.map(_lcs_block, tasks))
+    for rows_block, lengths in zip(blocks, results):
+        for (k, js), row in zip(rows_block, lengths):
+            for j, value in zip(js, row):
+                values[k, ub[j]] = value
+                if cache is not None:
+                    cache.put(k, ub[j], value)
+
+    L = np.array([[values[i, j] for j in kb] for i in ka], dtype=np.int64).reshape(len(A), len(B))
+    if not similarity:
+        return L
+    total = np.add.outer([len(a) for a in A], [len(b) for b in B])
+    return np.divide(2 * L, total, out=np.ones(L.shape), where=total > 0)
+
+
+def test_lcs():
+    for _ in range(200):
+        m, n = np.random.randint(0, 60, 2)
+        X = "".join(np.random.choice(list("ABCD"), m))
+        Y = "".join(np.random.choice(list("ABCD"), n))
+        length = lcs_length(X, Y)
+        assert lcs_length_bits(X, Y) == length
+        assert list(lcs_row(X, Y)) == [lcs_length(X, Y[:j]) for j in range(n + 1)]
+        for res in (LCS(X, Y), "".join(lcs_hirschberg(X, Y))):
+            assert len(res) == length
+            it, jt = iter(X), iter(Y)
+            assert all(ch in it for ch in res) and all(ch in jt for ch in res)
+    # NumPy arrays, large enough for the Hirschberg method.
+    X, Y = np.random.randint(0, 4, 300), np.random.randint(0, 4, 300)
+    res = LCS(X, Y)
+    assert len(res) == lcs_length(X, Y)
+    it, jt = iter(X.tolist()), iter(Y.tolist())
+    assert all(ch in it for ch in res) and all(ch in jt for ch in res)
+    print('[test_lcs] Passed.')
+
+
+def test_lcs_matrix():
+    A = ["".join(np.random.choice(list("ABC"), np.random.randint(0, 20))) for _ in range(30)]
+    B = A[:10] + ["".join(np.random.choice(list("ABC"), np.random.randint(0, 20))) for _ in range(10)]
+    expected = np.array([[lcs_length(a, b) for b in B] for a in A])
+    cache = LCSCache()
+    assert (lcs_matrix(A, B, cache=cache, n_workers=2, block=4) == expected).all()
+    assert (lcs_matrix(B, A, cache=cache, n_workers=1) == expected.T).all()
+    assert cache.misses == len(set(A)) * len(set(B))
+    # Long arrays that differ only where their repr elides the middle.
+    a = np.zeros(5000, dtype=np.int64)
+    b = a.copy()
+    b[2500] = 1
+    assert LCSCache.digest(a) != LCSCache.digest(b)
+    assert (lcs_matrix([a, b], [b], cache=LCSCache(), n_workers=1) == [[4999], [5000]]).all()
+    print('[test_lcs_matrix] Passed.')
 
 
 if __name__ == '__main__':
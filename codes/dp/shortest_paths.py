@@ -1,5 +1,159 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
 import numpy as np
-import copy
+
+
+def floyd_warshall(c):
+    """ Floyd-Warshall in O(n^2) memory: each k is one broadcast relaxation of d in place.
+    :param c: cost matrix (np.inf for missing arcs)
+    :return: distance matrix, next-hop matrix (nxt[i][j] is the vertex after i on the
+        shortest path from i to j, -1 if there is none)
+    """
+    d = np.array(c, dtype=float)
+    n = len(d)
+    nxt = np.where(np.isfinite(d), np.arange(n, dtype=np.int32)[None, :], -1).astype(np.int32)
+    via_k = np.empty_like(d)
+    better = np.empty(d.shape, dtype=bool)
+    for k in range(n):
+        np.add(d[:, k, None], d[None, k, :], out=via_k)
+        np.less(via_k, d, out=better)
+        np.minimum(d, via_k, out=d)
+        # The path from i to j now starts like the path from i to k.
+        np.copyto(nxt, nxt[:, k, None], where=better)
+    if (np.diag(d) < 0).any():
+        raise ValueError("The graph has a negative cycle.")
+    return d, nxt
+
+
+# "No path" in the int32 distance matrices of floyd_warshall_blocked: twice it still fits in int32.
+INT32_INF = (2 ** 31 - 1) // 2
+
+
+def _fw_tile(T, A, B):
+    """ T = min(T, A (min,+) B) in place, one k at a time; T may share memory with A or B
+    (the pivot row and column do not change in their own iteration).
+    """
+    buf = np.empty_like(T)
+    integral = T.dtype.kind == 'i'
+    for k in range(A.shape[1]):
+        np.add(A[:, k, None], B[k, None, :], out=buf)
+        if integral:
+            # A path through a missing arc stays missing, also with negative arcs.
+            buf[A[:, k] >= INT32_INF, :] = INT32_INF
+            buf[:, B[k] >= INT32_INF] = INT32_INF
+        np.minimum(T, buf, out=T)
+
+
+def floyd_warshall_blocked(c, block=256, n_workers=None, path=None, dtype=np.float32):
+    """ Blocked Floyd-Warshall. For each pivot block: the pivot tile, then the tiles of its row
+    and column, then all the other tiles; the tiles of a phase are independent and run on a thread
+    pool (NumPy releases the GIL). With path, the distances live in a memory-mapped file and the
+    next pivot block is saved to path + '.k' after each one, so an interrupted run resumes from there;
+    the checkpoint also records n, block and dtype, and is removed once the run completes.
+    :param c: cost matrix (np.inf for missing arcs), may itself be a memory-mapped array
+    :param block: tile size
+    :param n_workers: number of threads, default is the number of CPUs
+    :param path: file of the distance matrix, in memory if None
+    :param dtype: np.float32 or np.int32 (where INT32_INF means no path; the distances must
+        stay below INT32_INF in absolute value, and a finite cost that does not raises ValueError)
+    :return: distance matrix
+    """
+    n = len(c)
+    start = 0
+    checkpoint = None if path is None else path + '.k'
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            k, *meta = f.read().split()
+        if meta != [str(n), str(block), np.dtype(dtype).name]:
+            raise ValueError(f"floyd_warshall_blocked: the checkpoint {checkpoint} is of another run "
+                             f"(n, block, dtype = {', '.join(meta)}).")
+        start = int(k)
+        d = np.memmap(path, dtype=dtype, mode='r+', shape=(n, n))
+    else:
+        d = np.empty((n, n), dtype=dtype) if path is None else np.memmap(path, dtype=dtype, mode='w+', shape=(n, n))
+        for i in range(0, n, block):
+            rows = np.asarray(c[i: i + block], dtype=float)
+            if np.dtype(dtype).kind == 'i':
+                if (np.abs(rows[np.isfinite(rows)]) >= INT32_INF).any():
+                    raise ValueError(f"floyd_warshall_blocked: costs of int32 must be below {INT32_INF}.")
+                rows = np.where(np.isfinite(rows), np.minimum(rows, INT32_INF), INT32_INF)
+            d[i: i + block] = rows
+
+    tiles = [slice(i, min(i + block, n)) for i in range(0, n, block)]
+
+    def row_and_column(p, P, t):
+        R = np.array(d[p, t])
+        _fw_tile(R, P, R)
+        d[p, t] = R
+        T = np.array(d[t, p])
+        _fw_tile(T, T, P)
+        d[t, p] = T
+
+    def others(p, t):
+        A = np.array(d[t, p])
+        for u in tiles:
+            if u is not p:
+                T = np.array(d[t, u])
+                _fw_tile(T, A, np.array(d[p, u]))
+                d[t, u] = T
+
+    with ThreadPoolExecutor(n_workers or os.cpu_count()) as pool:
+        for b in range(start, len(tiles)):
+            p = tiles[b]
+            rest = tiles[:b] + tiles[b + 1:]
+            P = np.array(d[p, p])
+            _fw_tile(P, P, P)
+            d[p, p] = P
+            list(pool.map(lambda t: row_and_column(p, P, t), rest))
+            list(pool.map(lambda t: others(p, t), rest))
+            if checkpoint is not None:
+                d.flush()
+                with open(checkpoint + '.tmp', 'w') as f:
+                    f.write(f"{b + 1} {n} {block} {np.dtype(dtype).name}")
+                os.replace(checkpoint + '.tmp', checkpoint)
+
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    if (np.diagonal(d) < 0).any():
+        raise ValueError("The graph has a negative cycle.")
+    return d
+
+
+class Paths(object):
+    """ Shortest paths rebuilt on request from the next-hop matrix.
+    p[i][j] is the list of the intermediate vertices of the shortest path from i to j.
+    """
+
+    def __init__(self, nxt):
+        self._nxt = nxt
+
+    def __len__(self):
+        return len(self._nxt)
+
+    def __getitem__(self, i):
+        return _PathsRow(self, i)
+
+    def path(self, i, j):
+        nxt = self._nxt
+        if i == j or nxt[i][j] < 0:
+            return []
+        res = []
+        u = nxt[i][j]
+        while u != j:
+            res.append(int(u))
+            u = nxt[u][j]
+        return res
+
+
+class _PathsRow(object):
+
+    def __init__(self, paths, i):
+        self._paths = paths
+        self._i = i
+
+    def __getitem__(self, j):
+        return self._paths.path(self._i, j)
 
 
 def shortest_paths(c):
@@ -7,28 +161,8 @@ def shortest_paths(c):
     :param c: cost matrix
     :return: shortest paths and distance matrix
     """
-    n = len(c)
-    # Initialize length of shortest paths
-    d = np.full((n, n, n+1), np.inf)
-    d[:, :, 0] = copy.copy(c)
-    # Initialize shortest paths
-    p = np.empty((n, n, n+1), dtype=object)
-    for i in range(n):
-        for j in range(n):
-            # The list contains the intermediate vertices in the shortest path
-            p[i][j][0] = []
-
-    for k in range(1, n+1):
-        for i in range(n):
-            for j in range(n):
-                if d[i][j][k-1] > d[i][k-1][k-1] + d[k-1][j][k-1]:
-                    d[i][j][k] = d[i][k-1][k-1] + d[k-1][j][k-1]
-                    p[i][j][k] = p[i][k-1][k-1] + [k-1] + p[k-1][j][k-1]
-                else:
-                    d[i][j][k] = d[i][j][k-1]
-                    p[i][j][k] = p[i][j][k-1]
-
-    return p[:, :, n], d[:, :, n]
+    d, nxt = floyd_warshall(c)
+    return Paths(nxt), d
 
 
 def print_paths(p, c):
@@ -46,6 +180,58 @@ def print_paths(p, c):
             print(f"({i}, {j}): path = {path}, length = {path_length}")
 
 
+def test_shortest_paths():
+    for _ in range(20):
+        n = np.random.randint(1, 20)
+        c = random_instance(n).astype(float)
+        c[np.random.rand(n, n) < 0.3] = np.inf
+        np.fill_diagonal(c, 0)
+        p, d = shortest_paths(c)
+        # Bellman-Ford from every vertex
+        for i in range(n):
+            dist = c[i].copy()
+            for _ in range(n):
+                dist = np.minimum(dist, (dist[:, None] + c).min(axis=0))
+            assert np.array_equal(dist, d[i])
+            for j in range(n):
+                if i != j and np.isfinite(d[i][j]):
+                    path = [i] + p[i][j] + [j]
+                    assert sum(c[path[k]][path[k+1]] for k in range(len(path)-1)) == d[i][j]
+        assert np.array_equal(floyd_warshall_blocked(c, block=4, dtype=np.float64), d)
+    # Negative arcs must not make missing paths look finite in int32.
+    c = np.array([[0, np.inf, np.inf], [np.inf, 0, -5], [np.inf, np.inf, 0]])
+    for dtype in (np.float32, np.int32):
+        d = floyd_warshall_blocked(c, block=1, dtype=dtype)
+        missing = d == (np.inf if dtype == np.float32 else INT32_INF)
+        assert (missing == np.isinf(c)).all() and d[1, 2] == -5
+    try:
+        floyd_warshall_blocked(np.array([[0, INT32_INF], [1, 0]]), dtype=np.int32)
+        assert False
+    except ValueError:
+        pass
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'd')
+        c = random_instance(10).astype(float)
+        d = floyd_warshall(c)[0]
+        # A run interrupted after its first pivot block resumes from the checkpoint.
+        floyd_warshall_blocked(c, block=4, path=path, dtype=np.float64)
+        with open(path + '.k', 'w') as f:
+            f.write("1 10 4 float64")
+        assert np.array_equal(floyd_warshall_blocked(c, block=4, path=path, dtype=np.float64), d)
+        assert not os.path.exists(path + '.k')
+        c2 = random_instance(10).astype(float)
+        assert np.array_equal(floyd_warshall_blocked(c2, block=4, path=path, dtype=np.float64), floyd_warshall(c2)[0])
+        with open(path + '.k', 'w') as f:
+            f.write("1 10 4 float64")
+        try:
+            floyd_warshall_blocked(c, block=5, path=path, dtype=np.float64)
+            assert False
+        except ValueError:
+            pass
+    print('[test_shortest_paths] Passed.')
+
+
 def random_instance(n):
     """
     :param n: number of nodes
@@ -0,0 +1,220 @@
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+
+class CSRGraph(object):
+    """ Directed graph in compressed sparse row form: the arcs leaving u are
+    heads[indptr[u]:indptr[u+1]] with weights weights[indptr[u]:indptr[u+1]].
+    """
+
+    def __init__(self, n, tails, heads, weights):
+        """
+        :param n: number of nodes
+        :param tails: tail of each arc
+        :param heads: head of each arc
+        :param weights: weight of each arc
+        """
+        tails = np.asarray(tails, dtype=np.int64)
+        order = np.argsort(tails, kind='stable')
+        self.n = n
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(tails, minlength=n))))
+        self.heads = np.asarray(heads, dtype=np.int64)[order]
+        self.weights = np.asarray(weights, dtype=float)[order]
+
+    @classmethod
+    def from_matrix(cls, c):
+        """ Graph of a cost matrix, np.inf meaning no arc. """
+        c = np.asarray(c, dtype=float)
+        tails, heads = np.nonzero(np.isfinite(c) & ~np.eye(len(c), dtype=bool))
+        return cls(len(c), tails, heads, c[tails, heads])
+
+    @property
+    def tails(self):
+        return np.repeat(np.arange(self.n), np.diff(self.indptr))
+
+    def reweighted(self, h):
+        """ Graph with the weights w(u, v) + h[u] - h[v], which are nonnegative for Johnson's potentials. """
+        g = CSRGraph.__new__(CSRGraph)
+        g.n, g.indptr, g.heads = self.n, self.indptr, self.heads
+        g.weights = np.maximum(self.weights + h[self.tails] - h[self.heads], 0)
+        return g
+
+
+def dijkstra(graph, source, targets=None):
+    """ Dijkstra's algorithm with a binary heap; the graph must have nonnegative weights.
+    :param graph: CSRGraph
+    :param source: source node
+    :param targets: stop once these nodes are settled, default is to settle every reachable node
+    :return: distances and parents (dicts over the settled nodes)
+    """
+    indptr, heads, weights = graph.indptr, graph.heads, graph.weights
+    dist = {source: 0.0}
+    parent = {source: -1}
+    settled = set()
+    left = None if targets is None else set(targets)
+    heap = [(0.0, source)]
+    while heap:
+        du, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled.add(u)
+        if left is not None:
+            left.discard(u)
+            if not left:
+                break
+        a, b = indptr[u], indptr[u + 1]
+        for v, w in zip(heads[a:b].tolist(), weights[a:b].tolist()):
+            dv = du + w
+            if dv < dist.get(v, np.inf):
+                dist[v] = dv
+                parent[v] = u
+                heapq.heappush(heap, (dv, v))
+    return {u: dist[u] for u in settled}, {u: parent[u] for u in settled}
+
+
+def johnson_potentials(graph):
+    """ Bellman-Ford from a virtual source joined to every node with weight 0,
+    each round relaxing all the arcs at once.
+    :return: potentials h with w(u, v) + h[u] - h[v] >= 0
+    """
+    h = np.zeros(graph.n)
+    tails = graph.tails
+    for _ in range(graph.n):
+        h_new = h.copy()
+        np.minimum.at(h_new, graph.heads, h[tails] + graph.weights)
+        if np.array_equal(h_new, h):
+            return h
+        h = h_new
+    raise ValueError("The graph has a negative cycle.")
+
+
+def get_path(parent, target):
+    """ Path from the source of the Dijkstra run to target, None if target was not reached. """
+    if target not in parent:
+        return None
+    path = [target]
+    while parent[path[-1]] >= 0:
+        path.append(parent[path[-1]])
+    path.reverse()
+    return path
+
+
+def _answer(graph, h, source, targets):
+    """ Runs one Dijkstra for all the queries of a source. """
+    dist, parent = dijkstra(graph, source, targets)
+    res = []
+    for t in targets:
+        if t in dist:
+            d = dist[t] if h is None else dist[t] - h[source] + h[t]
+            res.append((source, t, d, get_path(parent, t)))
+        else:
+            res.append((source, t, np.inf, None))
+    return res
+
+
+# Graph and potentials of the worker processes of path_queries.
+_worker = {}
+
+
+def _init_worker(graph, h):
+    _worker['graph'], _worker['h'] = graph, h
+
+
+def _answer_in_worker(source, targets):
+    return _answer(_worker['graph'], _worker['h'], source, targets)
+
+
+def path_queries(graph, queries, n_workers=None, window=None):
+    """ Answers source-target queries, grouped by source, on a process pool.
+    Negative weights are handled with Johnson's reweighting. Results are yielded as soon as
+    they are ready (not in the order of the queries), at most window groups being in flight.
+    :param graph: CSRGraph
+    :param queries: iterable of (source, target)
+    :param n_workers: number of worker processes, default is the number of CPUs
+    :param window: maximum number of source groups submitted at once, default is 4 * n_workers
+    :return: generator of (source, target, distance, path)
+    """
+    h = None
+    if (graph.weights < 0).any():
+        h = johnson_potentials(graph)
+        graph = graph.reweighted(h)
+    groups = {}
+    for s, t in queries:
+        groups.setdefault(s, []).append(t)
+    n_workers = n_workers or os.cpu_count()
+    if n_workers == 1:
+        for s, targets in groups.items():
+            yield from _answer(graph, h, s, targets)
+        return
+    window = window or 4 * n_workers
+    with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(graph, h)) as pool:
+        groups = iter(groups.items())
+        pending = set()
+        while True:
+            for s, targets in groups:
+                pending.add(pool.submit(_answer_in_worker, s, targets))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def single_source(graph, source):
+    """ Distances from source to every node (np.inf if unreachable), with Johnson's
+    reweighting if some weights are negative.
+    """
+    h = None
+    if (graph.weights < 0).any():
+        h = johnson_potentials(graph)
+        graph = graph.reweighted(h)
+    dist, _ = dijkstra(graph, source)
+    d = np.full(graph.n, np.inf)
+    d[list(dist)] = list(dist.values())
+    if h is not None:
+        d += h - h[source]
+    return d
+
+
+def test_sparse_paths():
+    from shortest_paths import shortest_paths
+    for _ in range(20):
+        n = np.random.randint(1, 30)
+        c = np.random.randint(-5, 100, (n, n)).astype(float)
+        c[np.random.rand(n, n) < 0.7] = np.inf
+        np.fill_diagonal(c, 0)
+        try:
+            _, d = shortest_paths(c)
+        except ValueError:
+            continue
+        graph = CSRGraph.from_matrix(c)
+        for s in range(n):
+            assert np.allclose(single_source(graph, s), d[s])
+        queries = [(s, t) for s in range(n) for t in range(n) if s != t]
+        for s, t, dist, path in path_queries(graph, queries, n_workers=2):
+            assert np.isclose(dist, d[s][t])
+            if path is not None:
+                assert np.isclose(sum(c[path[k]][path[k+1]] for k in range(len(path)-1)), dist)
+    print('[test_sparse_paths] Passed.')
+
+
+def random_instance(n, degree=4):
+    """
+    :param n: number of nodes
+    :param degree: average out-degree
+    :return: random sparse graph with weights in [1, 1000)
+    """
+    m = n * degree
+    return CSRGraph(n, np.random.randint(0, n, m), np.random.randint(0, n, m), np.random.randint(1, 1000, m))
+
+
+if __name__ == '__main__':
+    graph = random_instance(10**5)
+    queries = [(np.random.randint(graph.n), np.random.randint(graph.n)) for _ in range(5)]
+    for s, t, dist, path in path_queries(graph, queries):
+        print(f"({s}, {t}): length = {dist}, path = {path}")
@@ -13,24 +13,99 @@ def binary_search(f, a, b):
         Left endpoint of the interval.
     b : float
         Right endpoint of the interval.
-    
+
     Returns
     -------
     float
-        Root of f(x) = 0 in the interval [a, b].
+        Root of f(x) = 0 in the interval [a, b], None if f has the same sign at a and b.
     """
+    fa, fb = f(a), f(b)
     while a < b:
         c = (a + b) / 2
-        if np.isclose(f(c), 0):
+        fc = f(c)
+        if np.isclose(fc, 0) or c == a or c == b:
             return c
-        elif f(a) * f(c) < 0:
-            return binary_search(f, a, c)
-        elif f(b) * f(c) < 0:
-            return binary_search(f, c, b)
+        elif fa * fc < 0:
+            b, fb = c, fc
+        elif fb * fc < 0:
+            a, fa = c, fc
         else:
             return None
 
-    
+
+def binary_search_vec(f, a, b, args=(), xtol=1e-12, rtol=4 * np.finfo(float).eps, max_iter=200):
+    """
+    Binary search on a vector of independent equations f(x[i], *args[i]) = 0 with the
+    brackets [a[i], b[i]]; f is evaluated once per step, on the elements not yet converged.
+
+    Parameters
+    ----------
+    f : function
+        Vectorized function, called as f(x, *args).
+    a : array_like
+        Left endpoints.
+    b : array_like
+        Right endpoints.
+    args : tuple of array_like, optional
+        Per-element parameters of f, aligned with a and b.
+    xtol : float, optional
+        Width of the brackets at which an element stops.
+    rtol : float, optional
+        Relative width of the brackets at which an element stops: the width xtol + rtol * |x|
+        is reached even where the spacing of the floats exceeds xtol. An element also stops
+        once its midpoint equals an endpoint.
+    max_iter : int, optional
+        Maximum number of steps.
+
+    Returns
+    -------
+    x : ndarray
+        Roots (midpoints of the last brackets).
+    iterations : ndarray
+        Number of steps of every element.
+    failed : ndarray
+        True where f has the same sign at both endpoints or the bracket is still too wide.
+    """
+    a, b = np.array(a, dtype=float).ravel(), np.array(b, dtype=float).ravel()
+    fa, fb = f(a, *args), f(b, *args)
+    failed = np.sign(fa) * np.sign(fb) > 0
+    x = np.where(fa == 0, a, np.where(fb == 0, b, (a + b) / 2))
+    iterations = np.zeros(len(x), dtype=np.int64)
+    active = np.flatnonzero(~failed & (fa != 0) & (fb != 0))
+    sa = np.sign(fa)
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        la, ha = a[active], b[active]
+        c = (la + ha) / 2
+        fc = f(c, *[np.asarray(arg)[active] for arg in args])
+        iterations[active] += 1
+        left = np.sign(fc) == sa[active]
+        a[active], b[active] = np.where(left, c, la), np.where(left, ha, c)
+        x[active] = np.where(fc == 0, c, (a[active] + b[active]) / 2)
+        stuck = (c == la) | (c == ha)
+        active = active[(fc != 0) & ~stuck & (b[active] - a[active] >= xtol + rtol * np.abs(c))]
+    failed[active] = True
+    return x, iterations, failed
+
+
+def test_binary_search_vec():
+    n = 1000
+    k = np.random.rand(n) * 4
+    x, iterations, failed = binary_search_vec(lambda x, k: x ** 2 - k, np.zeros(n), np.full(n, 2.0), (k,))
+    assert not failed.any() and np.allclose(x, np.sqrt(k)) and iterations.max() <= 45
+    # Large roots, where the floats are further apart than xtol.
+    x, iterations, failed = binary_search_vec(lambda x, c: x - c, [0, 0], [1e11, 1e6], ([1e10 + 0.3, 0.5],))
+    assert not failed.any() and np.allclose(x, [1e10 + 0.3, 0.5], rtol=1e-15) and iterations.max() < 100
+    x, iterations, failed = binary_search_vec(lambda x: x ** 2 - 2e11, [0], [1e6])
+    assert not failed.any() and np.isclose(x[0], np.sqrt(2e11), rtol=1e-15) and iterations[0] < 100
+    x, _, failed = binary_search_vec(lambda x: x ** 2 + 1, [0, -1], [1, 1])
+    assert failed.all()
+    assert np.isclose(binary_search(lambda x: x ** 2 - 2, 0, 2), np.sqrt(2))
+    assert binary_search(lambda x: x ** 2 + 1, 0, 2) is None
+    print('[test_binary_search_vec] Passed.')
+
+
 if __name__ == '__main__':
     f = lambda x: x**2 - 2
     a, b = 0, 2
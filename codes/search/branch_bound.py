@@ -0,0 +1,281 @@
+import bisect
+import heapq
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+
+
+SearchResult = namedtuple('SearchResult', ['value', 'solution', 'exact', 'expanded'])
+
+
+class SearchProblem(object):
+    """ Maximization problem whose states decide the items in order. A state is a tuple of
+    integers starting with the index of the next item, e.g. (index, running sum);
+    the search links every node to its parent instead of copying the partial solution.
+    """
+
+    # Largest possible value: the search stops once it is reached.
+    upper = np.inf
+
+    def root(self):
+        raise NotImplementedError
+
+    def children(self, state):
+        raise NotImplementedError
+
+    def value(self, state):
+        """ Value of the solution of state. """
+        raise NotImplementedError
+
+    def bound(self, state):
+        """ Upper bound of the values of the states below state. """
+        raise NotImplementedError
+
+    def key(self, state):
+        """ Hashable key of the duplicate states, of which only the best valued one is kept. """
+        return state
+
+    def decode(self, states):
+        """ Solution from the states of the path from the root. """
+        return states
+
+
+def suffix_sum_bound(problem, state):
+    """ Subset sum: the running sum plus all the remaining numbers, capped at the target. """
+    i, s = state
+    return min(problem.target, s + problem.suffix[i])
+
+
+def lp_bound(problem, state):
+    """ Knapsack: the value plus the fractional (LP) filling of the remaining capacity
+    with the remaining items in decreasing order of v/w.
+    """
+    i, weight, value = state
+    room = problem.C - weight
+    k = bisect.bisect_right(problem.W, problem.W[i] + room) - 1
+    bound = value + problem.V[k] - problem.V[i]
+    if k < problem.n:
+        bound += (problem.W[i] + room - problem.W[k]) * problem.v[k] / problem.w[k]
+    return bound
+
+
+class SubsetSumProblem(SearchProblem):
+    """ Largest subset sum of nonnegative numbers not exceeding target; state (index, sum). """
+
+    def __init__(self, numbers, target, bound=suffix_sum_bound):
+        self.order = sorted(range(len(numbers)), key=lambda i: numbers[i], reverse=True)
+        self.numbers = [numbers[i] for i in self.order]
+        if self.numbers and self.numbers[-1] < 0:
+            raise ValueError("SubsetSumProblem: the numbers must be nonnegative.")
+        self.target = self.upper = target
+        self.suffix = np.concatenate((np.cumsum(self.numbers[::-1])[::-1], [0])).tolist()
+        self._bound = bound
+
+    def root(self):
+        return 0, 0
+
+    def children(self, state):
+        i, s = state
+        if i == len(self.numbers):
+            return ()
+        x = self.numbers[i]
+        if s + x <= self.target:
+            return (i + 1, s + x), (i + 1, s)
+        return (i + 1, s),
+
+    def value(self, state):
+        return state[1]
+
+    def bound(self, state):
+        return self._bound(self, state)
+
+    def decode(self, states):
+        """ Indices of the numbers taken. """
+        return sorted(self.order[a[0]] for a, b in zip(states, states[1:]) if b[1] != a[1])
+
+
+class KnapsackProblem(SearchProblem):
+    """ 0/1 knapsack; state (index, weight, value), the items sorted by v/w. """
+
+    def __init__(self, w, v, C, bound=lp_bound):
+        self.order = [i for i in sorted(range(len(w)), key=lambda i: v[i] / w[i] if w[i] else np.inf, reverse=True)
+                      if w[i] <= C]
+        self.w = [w[i] for i in self.order]
+        self.v = [v[i] for i in self.order]
+        self.n, self.C = len(self.order), C
+        # Prefix sums for the LP bound.
+        self.W = np.concatenate(([0], np.cumsum(self.w))).tolist()
+        self.V = np.concatenate(([0], np.cumsum(self.v))).tolist()
+        self._bound = bound
+
+    def root(self):
+        return 0, 0, 0
+
+    def children(self, state):
+        i, weight, value = state
+        if i == self.n:
+            return ()
+        if weight + self.w[i] <= self.C:
+            return (i + 1, weight + self.w[i], value + self.v[i]), (i + 1, weight, value)
+        return (i + 1, weight, value),
+
+    def value(self, state):
+        return state[2]
+
+    def bound(self, state):
+        return self._bound(self, state)
+
+    def key(self, state):
+        return state[0], state[1]
+
+    def decode(self, states):
+        """ Indices of the items packed (the weight or the value changes, for zero weights). """
+        return sorted(self.order[a[0]] for a, b in zip(states, states[1:]) if b[1:] != a[1:])
+
+
+def branch_and_bound(problem, strategy='best', beam_width=100, max_frontier=None, visited=True,
+                     max_visited=10**6):
+    """ Branch and bound for a SearchProblem. A node is a (state, parent node) pair. Nodes whose
+    bound does not exceed the best value found are pruned.
+    :param problem: SearchProblem
+    :param strategy: 'best' (best-first on the bound), 'dfs' (depth-first) or
+        'beam' (level by level, keeping the beam_width nodes of largest bound)
+    :param beam_width: width of the beam search
+    :param max_frontier: largest number of open nodes, the ones of smallest bound (or the
+        deepest in the stack for dfs) being dropped beyond it; no limit if None
+    :param visited: skip a state if a state with the same key and at least its value was seen
+    :param max_visited: largest number of keys remembered for visited, the oldest half being
+        forgotten beyond it (which only weakens the pruning); no limit if None
+    :return: SearchResult(value, solution, exact, expanded), exact being False if some nodes
+        were dropped by beam_width or max_frontier
+    """
+    best_value, best_node = -np.inf, None
+    seen = {} if visited else None
+    exact = True
+    expanded = 0
+
+    def admit(node):
+        """ Updates the best solution with node; returns its bound, or None if it is pruned. """
+        nonlocal best_value, best_node
+        state = node[0]
+        value = problem.value(state)
+        if seen is not None:
+            key = problem.key(state)
+            if seen.get(key, -np.inf) >= value:
+                return None
+            seen[key] = value
+            if max_visited is not None and len(seen) > max_visited:
+                for old in list(islice(seen, len(seen) // 2)):
+                    del seen[old]
+        if value > best_value:
+            best_value, best_node = value, node
+        bound = problem.bound(state)
+        return bound if bound > best_value else None
+
+    root = (problem.root(), None)
+    root_bound = admit(root)
+    if strategy == 'best':
+        # Ties of the bound go to the deepest node, then to the newest one.
+        frontier = [] if root_bound is None else [(-root_bound, 0, 0, root)]
+        count = 1
+        while frontier and best_value < problem.upper:
+            neg_bound, _, _, node = heapq.heappop(frontier)
+            if -neg_bound <= best_value:
+                break
+            expanded += 1
+            for state in problem.children(node[0]):
+                child = (state, node)
+                bound = admit(child)
+                if bound is not None:
+                    heapq.heappush(frontier, (-bound, -state[0], -count, child))
+                    count += 1
+            if max_frontier is not None and len(frontier) > max_frontier:
+                frontier = heapq.nsmallest(max_frontier // 2, frontier)
+                exact = False
+    elif strategy == 'dfs':
+        frontier = [] if root_bound is None else [(root_bound, root)]
+        while frontier and best_value < problem.upper:
+            bound, node = frontier.pop()
+            if bound <= best_value:
+                continue
+            expanded += 1
+            children = []
+            for state in problem.children(node[0]):
+                child = (state, node)
+                b = admit(child)
+                if b is not None:
+                    children.append((b, child))
+            frontier.extend(reversed(children))
+            if max_frontier is not None and len(frontier) > max_frontier:
+                del frontier[:len(frontier) - max_frontier]
+                exact = False
+    elif strategy == 'beam':
+        level = [] if root_bound is None else [(root_bound, root)]
+        while level and best_value < problem.upper:
+            children = []
+            for bound, node in level:
+                if bound <= best_value:
+                    continue
+                expanded += 1
+                for state in problem.children(node[0]):
+                    child = (state, node)
+                    b = admit(child)
+                    if b is not None:
+                        children.append((b, child))
+            width = beam_width if max_frontier is None else min(beam_width, max_frontier)
+            if len(children) > width:
+                children = heapq.nlargest(width, children, key=lambda c: c[0])
+                exact = False
+            level = children
+    else:
+        raise ValueError(f"Unknown strategy {strategy}.")
+    states = []
+    while best_node is not None:
+        states.append(best_node[0])
+        best_node = best_node[1]
+    return SearchResult(best_value, problem.decode(states[::-1]), exact, expanded)
+
+
+def test_branch_and_bound():
+    import importlib.util
+    import os
+    from subset_sum import subset_sum
+    spec = importlib.util.spec_from_file_location(
+        'knapsack', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dp', 'knapsack.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    knapsack = module.knapsack
+    for _ in range(100):
+        n = np.random.randint(0, 15)
+        numbers = np.random.randint(0, 50, n).tolist()
+        target = np.random.randint(0, sum(numbers) + 5)
+        exists = subset_sum(numbers, target) is not None
+        w, v = np.random.randint(1, 30, n).tolist(), np.random.randint(1, 30, n).tolist()
+        C = np.random.randint(1, 100)
+        opt, _ = knapsack(w, v, C)
+        for strategy in ('best', 'dfs', 'beam'):
+            for visited in (True, False):
+                # A beam as wide as the tree, so that the search is exact.
+                res = branch_and_bound(SubsetSumProblem(numbers, target), strategy, 1 << n, visited=visited)
+                assert sum(numbers[i] for i in res.solution) == res.value <= target
+                assert res.exact and (res.value == target) == exists
+                res = branch_and_bound(KnapsackProblem(w, v, C), strategy, 1 << n, visited=visited)
+                assert res.exact and res.value == opt
+                assert sum(w[i] for i in res.solution) <= C and sum(v[i] for i in res.solution) == opt
+            res = branch_and_bound(KnapsackProblem(w, v, C), strategy, beam_width=2, max_frontier=4)
+            assert sum(w[i] for i in res.solution) <= C and sum(v[i] for i in res.solution) == res.value <= opt
+            res = branch_and_bound(KnapsackProblem(w, v, C), strategy, 1 << n, max_visited=4)
+            assert res.exact and res.value == opt == sum(v[i] for i in res.solution)
+    res = branch_and_bound(KnapsackProblem([0, 5], [10, 3], 4))
+    assert res.value == 10 and res.solution == [0]
+    print('[test_branch_and_bound] Passed.')
+
+
+if __name__ == "__main__":
+    numbers = np.random.randint(1, 10**4, 1000).tolist()
+    res = branch_and_bound(SubsetSumProblem(numbers, sum(numbers) // 3))
+    print(f"subset sum: value = {res.value}, target = {sum(numbers) // 3}, expanded = {res.expanded}")
+    w, v = np.random.randint(1, 1000, 1000).tolist(), np.random.randint(1, 1000, 1000).tolist()
+    res = branch_and_bound(KnapsackProblem(w, v, sum(w) // 4), 'dfs')
+    print(f"knapsack: value = {res.value}, exact = {res.exact}, expanded = {res.expanded}")
@@ -1,64 +1,628 @@
+from collections import deque, namedtuple
+import csv
+import json
+import time
+
+import numpy as np
+
+
+# Event passed to TSP2opt.callback: number of improving moves so far, current tour length,
+# name of the neighborhood of the move, seconds since solve() started, moves evaluated per second.
+Progress = namedtuple('Progress', ['iteration', 'length', 'move', 'elapsed', 'evaluations_per_second'])
+
+
+class PrintProgress(object):
+    """ Callback that prints every improving move. """
+
+    def __call__(self, progress):
+        print(">> iter = %d, tour length = %d, move = %s" % (progress.iteration, progress.length, progress.move))
+
+
+class Trace(object):
+    """ Callback that records the progress of one or several runs, for convergence plots.
+    Set the run attribute before each run to tell the runs apart.
+    """
+
+    fields = ('run',) + Progress._fields
+
+    def __init__(self, run=0):
+        self.run = run
+        self.records = []
+
+    def __call__(self, progress):
+        self.records.append((self.run,) + tuple(progress))
+
+    def _rows(self):
+        # Plain Python numbers, so that the values can be serialized.
+        return [[x.item() if isinstance(x, np.generic) else x for x in r] for r in self.records]
+
+    def to_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.fields)
+            writer.writerows(self._rows())
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump([dict(zip(self.fields, r)) for r in self._rows()], f)
+
+
+class Neighborhood(object):
+    """ A family of moves around a city, to be plugged into TSP2opt.
+    search(tsp, a) applies the first improving move that involves city a and returns
+    the cities whose arcs changed, or None if there is no such move. Moves are scored
+    by their delta and applied in place, the tour is never copied.
+    """
+
+    name = None
+
+    def search(self, tsp, a):
+        raise NotImplementedError
+
+
+class TwoOpt(Neighborhood):
+
+    name = '2opt'
+
+    def search(self, tsp, a):
+        """ Search the 2opt moves that connect city a to one of its neighbors.
+        :param tsp: TSP2opt instance
+        :param a: city
+        :return: the cities whose arcs changed if a better solution is found, None otherwise
+        """
+        n, d, order, pos = tsp._n, tsp._d, tsp._order, tsp._pos
+        i = pos[a]
+        b = order[(i + 1) % n]
+        prv = order[i - 1]
+        for c in tsp._neighbors[a]:
+            d_ac = d[a, c]
+            if d_ac >= d[a, b] and d_ac >= d[prv, a]:
+                # Sorted candidate list: no later neighbor can give a gain.
+                break
+            j = pos[c]
+            # Successor direction: a b ... c e -> a c ... b e
+            e = order[(j + 1) % n]
+            if c != b and e != a and d_ac < d[a, b]:
+                tsp._evaluations += 1
+                delta = d_ac + d[b, e] - d[a, b] - d[c, e] + tsp._reversal_delta((i + 1) % n, j)
+                if delta < 0:
+                    tsp._reverse((i + 1) % n, j)
+                    tsp._length += delta
+                    return a, b, c, e
+            # Predecessor direction: e c ... prv a -> e prv ... c a
+            e = order[j - 1]
+            if c != prv and e != a and d[c, a] < d[prv, a]:
+                tsp._evaluations += 1
+                delta = d[e, prv] + d[c, a] - d[e, c] - d[prv, a] + tsp._reversal_delta(j, i - 1)
+                if delta < 0:
+                    tsp._reverse(j, (i - 1) % n)
+                    tsp._length += delta
+                    return a, prv, c, e
+        return None
+
+
+class OrOpt(Neighborhood):
+    """ Or-opt: move a segment of consecutive cities between two other adjacent cities,
+    either as it is or reversed (the 3-opt "segment reversal" move).
+    """
+
+    name = 'or-opt'
+
+    def __init__(self, lengths=(1, 2, 3), reverse=True):
+        """
+        :param lengths: lengths of the segments to move
+        :param reverse: whether to try inserting the segment reversed
+        """
+        self.lengths = lengths
+        self.reverse = reverse
+
+    def _segments(self, tsp, a):
+        """ Segments (as lists of cities) that start or end at city a. """
+        for k in self.lengths:
+            if k + 2 > tsp._n:
+                continue
+            seg = [a]
+            for _ in range(k - 1):
+                seg.append(tsp._succ(seg[-1]))
+            yield seg
+            if k > 1:
+                seg = [a]
+                for _ in range(k - 1):
+                    seg.append(tsp._pred(seg[-1]))
+                yield seg[::-1]
+
+    def search(self, tsp, a):
+        """ Search the moves that place the segment next to a neighbor of city a.
+        :param tsp: TSP2opt instance
+        :param a: city at either end of the moved segment
+        :return: the cities whose arcs changed if a better solution is found, None otherwise
+        """
+        d = tsp._d
+        for seg in self._segments(tsp, a):
+            s1, s2 = seg[0], seg[-1]
+            p, n1 = tsp._pred(s1), tsp._succ(s2)
+            gain = d[p, s1] + d[s2, n1] - d[p, n1]
+            # Extra cost of traversing the segment backwards (0 for symmetric distances).
+            flip = sum(d[v, u] - d[u, v] for u, v in zip(seg, seg[1:]))
+            for c in tsp._neighbors[a]:
+                if d[a, c] >= gain:
+                    break
+                if c in seg:
+                    continue
+                # Insert between c and its successor, or between its predecessor and c.
+                for x, y in ((c, tsp._succ(c)), (tsp._pred(c), c)):
+                    if x in seg or y in seg:
+                        continue
+                    tsp._evaluations += 1
+                    delta = d[x, s1] + d[s2, y] - d[x, y] - gain
+                    if delta < 0:
+                        self._move(tsp, seg, x, y, False)
+                        tsp._length += delta
+                        return p, n1, s1, s2, x, y
+                    if self.reverse and len(seg) > 1:
+                        tsp._evaluations += 1
+                        delta = d[x, s2] + d[s1, y] - d[x, y] - gain + flip
+                        if delta < 0:
+                            self._move(tsp, seg, x, y, True)
+                            tsp._length += delta
+                            return p, n1, s1, s2, x, y
+        return None
+
+    @staticmethod
+    def _move(tsp, seg, x, y, reverse):
+        """ Move the segment between x and y as a sequence of 2opt moves:
+        p s1..s2 n1 ... x y -> p x ... n1 s2..s1 y -> p n1 ... x s2..s1 y [-> p n1 ... x s1..s2 y]
+        """
+        s1, s2 = seg[0], seg[-1]
+        p, n1 = tsp._pred(s1), tsp._succ(s2)
+        tsp._move_2opt(p, s1, x, y)
+        if x != n1:
+            tsp._move_2opt(p, x, n1, s2)
+        if not reverse and s1 != s2:
+            tsp._move_2opt(x, s2, s1, y)
+
+
+class NodeInsertion(OrOpt):
+    """ Move a single city between two other adjacent cities. """
+
+    name = 'insertion'
+
+    def __init__(self):
+        super().__init__(lengths=(1,), reverse=False)
+
+
 class TSP2opt(object):
 
     max_iter = 1000
+    n_neighbors = 10  # length of the candidate list of each city
+    neighborhoods = (TwoOpt(), OrOpt())
+    max_time = None  # seconds, no limit if None
+    target_length = None  # stop as soon as the tour is at most this long
+    stop_event = None  # e.g. a multiprocessing.Event, stop as soon as it is set
+    callback = None  # called with a Progress after every improving move, see PrintProgress and Trace
 
-    def __init__(self, d):
+    def __init__(self, d, neighborhoods=None, tour=None):
         """
         :param d: distance matrix
+        :param neighborhoods: neighborhoods in the order of the descent, default is TSP2opt.neighborhoods
+        :param tour: cities in the order of the initial tour, default is 0, 1, ..., n-1
         """
-        self._d = d
+        if neighborhoods is not None:
+            self.neighborhoods = tuple(neighborhoods)
+        self._d = np.asarray(d)
         self._n = len(d)
         self._iter = 0
-        # Start with a trivial solution.
-        self.tour = [(i, i+1) for i in range(self._n-1)] + [(self._n-1, 0)]
-
-    def _2opt(self, i, j):
-        """ Search with 2opt. If a better solution is found, update the current tour.
-        :param i: index of the tour, indicating self.tour[i]
-        :param j: index of the tour, indicating self.tour[j]
-        :return: True if a better solution is found, False otherwise
+        self._evaluations = 0  # number of candidate moves evaluated
+        self._scans = 0  # number of cities whose candidate list was searched
+        # Asymmetric matrices need the cost of the reversed segment in the delta.
+        self._symmetric = bool(np.array_equal(self._d, self._d.T))
+        # Start with a trivial solution unless a tour is given.
+        # self._order[p] is the city at position p and self._pos[u] is the position of city u,
+        # so the successor of u is self._order[(self._pos[u] + 1) % n].
+        self._order = np.arange(self._n) if tour is None else np.array(tour)
+        self._pos = np.empty(self._n, dtype=self._order.dtype)
+        self._pos[self._order] = np.arange(self._n)
+        self._length = self._d[self._order, np.roll(self._order, -1)].sum()
+        self._update_cumsum()
+        self._neighbors = self._nearest_neighbors(min(self.n_neighbors, self._n - 1))
+
+    def _nearest_neighbors(self, k, block=1024):
+        """ Candidate lists: the k nearest cities of each city, sorted by distance.
+        The rows are processed in blocks to bound the memory of argpartition.
         """
-        u, v = self.tour[i]
-        s, t = self.tour[j]
-        part1 = self.tour[0: i]
-        part2 = [(u, s)]
-        part3 = [(self.tour[i + j - k][1], self.tour[i + j - k][0]) for k in range(i + 1, j)]
-        part4 = [(v, t)]
-        part5 = self.tour[j + 1: ]
-        new_tour = part1 + part2 + part3 + part4 + part5
-        new_tour_length = sum([self._d[i][j] for (i, j) in new_tour])
-        if new_tour_length < self.tour_length:
-            self.tour = new_tour
-            return True
-        return False
+        neighbors = []
+        if k <= 0:
+            return [[] for _ in range(self._n)]
+        for start in range(0, self._n, block):
+            rows = np.array(self._d[start: start + block], dtype=float)
+            rows[np.arange(len(rows)), np.arange(start, start + len(rows))] = np.inf
+            idx = np.argpartition(rows, k - 1, axis=1)[:, :k]
+            keys = np.take_along_axis(rows, idx, axis=1)
+            idx = np.take_along_axis(idx, np.argsort(keys, axis=1), axis=1)
+            neighbors += idx.tolist()
+        return neighbors
+
+    def _update_cumsum(self):
+        """ Prefix sums of the arc lengths along the tour, in both directions.
+        Only needed when the distance matrix is asymmetric.
+        """
+        if self._symmetric:
+            return
+        nxt = np.roll(self._order, -1)
+        self._fwd = np.concatenate(([0], np.cumsum(self._d[self._order, nxt])))
+        self._bwd = np.concatenate(([0], np.cumsum(self._d[nxt, self._order])))
+
+    def _path_sum(self, cum, p, m):
+        """ Sum of the m arcs starting at position p (cyclic). """
+        if p + m <= self._n:
+            return cum[p + m] - cum[p]
+        return cum[self._n] - cum[p] + cum[p + m - self._n]
+
+    def _reversal_delta(self, p, q):
+        """ Change of length caused by reversing the inner arcs of the segment [p, q]. """
+        if self._symmetric:
+            return 0
+        m = (q - p) % self._n
+        return self._path_sum(self._bwd, p, m) - self._path_sum(self._fwd, p, m)
+
+    def _reverse(self, p, q):
+        """ Reverse the cyclic segment of the tour from position p to position q. """
+        n = self._n
+        m = (q - p) % n + 1
+        if self._symmetric and 2 * m > n:
+            # Reversing the complement gives the same cycle with less work.
+            p, q, m = (q + 1) % n, (p - 1) % n, n - m
+        if p + m <= n:
+            seg = self._order[p: p + m]
+            self._order[p: p + m] = seg[::-1].copy()
+            self._pos[self._order[p: p + m]] = np.arange(p, p + m)
+        else:
+            idx = (p + np.arange(m)) % n
+            self._order[idx] = self._order[idx[::-1]]
+            self._pos[self._order[idx]] = idx
+        self._update_cumsum()
+
+    def _succ(self, u):
+        return self._order[(self._pos[u] + 1) % self._n]
+
+    def _pred(self, u):
+        return self._order[self._pos[u] - 1]
+
+    def _move_2opt(self, a, b, c, e):
+        """ Replace the arcs (a, b) and (c, e) by (a, c) and (b, e), where b follows a
+        and e follows c in the direction of the cycle.
+        """
+        if self._succ(a) == b:
+            self._reverse(self._pos[b], self._pos[c])
+        else:
+            # The array stores the cycle in the opposite direction.
+            self._reverse(self._pos[c], self._pos[b])
+
+    @property
+    def tour(self):
+        order = self._order.tolist()
+        return list(zip(order, order[1:] + order[:1]))
 
     @property
     def tour_length(self):
-        return sum([self._d[i][j] for (i, j) in self.tour])
+        return self._length
 
-    def _print_iter(self):
-        print(">> iter = %d, tour length = %d" % (self._iter, self.tour_length))
+    def _stopped(self, deadline):
+        if deadline is not None and time.perf_counter() > deadline:
+            return True
+        return self.stop_event is not None and self.stop_event.is_set()
 
     def solve(self):
-        is_improved = True
-        while is_improved:
-            current_length = self.tour_length
-            for i in range(self._n):
-                for j in range(i + 1, self._n):
-                    if self._2opt(i, j):
-                        self._iter += 1
-                        self._print_iter()
-                        if self._iter == self.max_iter:
-                            return self
-
-            is_improved = current_length - self.tour_length > 0
+        start = time.perf_counter()
+        deadline = None if self.max_time is None else start + self.max_time
+        # Don't-look bits: only the cities in the queue are searched.
+        queue = deque(range(self._n))
+        active = [True] * self._n
+        while queue and not self._stopped(deadline):
+            a = queue.popleft()
+            active[a] = False
+            self._scans += 1
+            changed = None
+            # Variable neighborhood descent: go back to the first neighborhood after an improvement.
+            for neighborhood in self.neighborhoods:
+                changed = neighborhood.search(self, a)
+                if changed is not None:
+                    break
+            if changed is None:
+                continue
+            self._iter += 1
+            if self.callback is not None:
+                elapsed = time.perf_counter() - start
+                self.callback(Progress(self._iter, self._length, neighborhood.name, elapsed,
+                                       self._evaluations / elapsed if elapsed > 0 else 0.0))
+            if self._iter == self.max_iter:
+                return self
+            if self.target_length is not None and self._length <= self.target_length:
+                return self
+            for u in changed:
+                if not active[u]:
+                    active[u] = True
+                    queue.append(u)
 
         return self
 
 
+def random_tour(d, rng):
+    """ A random permutation of the cities. """
+    return rng.permutation(len(d))
+
+
+def nearest_neighbor_tour(d, rng):
+    """ Start from a random city and always go to the nearest unvisited city. """
+    n = len(d)
+    visited = np.zeros(n, dtype=bool)
+    order = [int(rng.integers(n))]
+    visited[order[0]] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, d[order[-1]])
+        order.append(int(np.argmin(row)))
+        visited[order[-1]] = True
+    return np.array(order)
+
+
+def greedy_edge_tour(d, rng, k=10):
+    """ Add the shortest edges among the k nearest neighbors that keep every degree at most 2
+    and close no cycle, then join the resulting paths end to end. rng breaks ties.
+    """
+    n = len(d)
+    d = np.asarray(d)
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.arange(n)
+    rows = np.array(d, dtype=float)
+    np.fill_diagonal(rows, np.inf)
+    nbr = np.argpartition(rows, k - 1, axis=1)[:, :k]
+    del rows
+    u = np.repeat(np.arange(n), k)
+    v = nbr.ravel()
+    w = d[u, v] + d[v, u]
+    edges = np.lexsort((rng.random(len(w)), w))
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    adj = [[] for _ in range(n)]
+    for e in edges.tolist():
+        a, b = int(u[e]), int(v[e])
+        if len(adj[a]) == 2 or len(adj[b]) == 2:
+            continue
+        ra, rb = find(a), find(b)
+        if ra == rb:
+            continue
+        parent[ra] = rb
+        adj[a].append(b)
+        adj[b].append(a)
+
+    # Walk each path from one of its ends.
+    visited = [False] * n
+    paths = []
+    for s in [x for x in range(n) if len(adj[x]) < 2]:
+        if visited[s]:
+            continue
+        path, prev, cur = [], None, s
+        while cur is not None:
+            visited[cur] = True
+            path.append(cur)
+            nxt = [x for x in adj[cur] if x != prev]
+            prev, cur = cur, (nxt[0] if nxt else None)
+        paths.append(path)
+
+    # Chain the paths, always continuing with the path that has the nearest end.
+    heads = np.array([p[0] for p in paths])
+    tails = np.array([p[-1] for p in paths])
+    left = np.ones(len(paths), dtype=bool)
+    left[0] = False
+    order = list(paths[0])
+    for _ in range(len(paths) - 1):
+        to_head = np.where(left, d[order[-1], heads], np.inf)
+        to_tail = np.where(left, d[order[-1], tails], np.inf)
+        if to_head.min() <= to_tail.min():
+            i = int(np.argmin(to_head))
+            order += paths[i]
+        else:
+            i = int(np.argmin(to_tail))
+            order += paths[i][::-1]
+        left[i] = False
+    return np.array(order)
+
+
+START_TOURS = {
+    'random': random_tour,
+    'nearest': nearest_neighbor_tour,
+    'greedy': greedy_edge_tour,
+}
+
+# Distance matrix and stop event shared with the workers of multi_start.
+_shared = {}
+
+
+def _init_worker(shm_name, shape, dtype, stop_event):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared['shm'] = shm  # keep the buffer alive
+    _shared['d'] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _shared['stop_event'] = stop_event
+
+
+def _solve_start(kind, seed, deadline, target_length, neighborhoods, max_iter):
+    """ Run one start of multi_start in a worker process. """
+    import os
+    d, stop_event = _shared['d'], _shared['stop_event']
+    start = time.time()
+    stats = {'kind': kind, 'seed': seed, 'pid': os.getpid()}
+    if stop_event.is_set() or (deadline is not None and start >= deadline):
+        return None, stats
+    tsp = TSP2opt(d, neighborhoods, tour=START_TOURS[kind](d, np.random.default_rng(seed)))
+    tsp.max_iter = max_iter
+    tsp.max_time = None if deadline is None else deadline - time.time()
+    tsp.target_length = target_length
+    tsp.stop_event = stop_event
+    stats['start_length'] = float(tsp.tour_length)
+    tsp.solve()
+    if target_length is not None and tsp.tour_length <= target_length:
+        stop_event.set()
+    stats.update(length=float(tsp.tour_length), iters=tsp._iter, evaluations=tsp._evaluations,
+                 time=time.time() - start)
+    return tsp._order.tolist(), stats
+
+
+def multi_start(d, n_starts=8, kinds=('random', 'nearest', 'greedy'), n_workers=None,
+                time_limit=None, target_length=None, seed=0, neighborhoods=None, max_iter=10**9):
+    """ Multi-start local search: run TSP2opt from n_starts independently seeded initial tours
+    on a process pool. The distance matrix is placed in shared memory instead of being pickled
+    to every worker. All the starts stop once the time limit or the target length is reached.
+    :param d: distance matrix
+    :param n_starts: number of starts
+    :param kinds: kinds of initial tours (keys of START_TOURS), used in turn
+    :param n_workers: number of worker processes, default is the number of CPUs
+    :param time_limit: time budget in seconds, no limit if None
+    :param target_length: stop all the starts once a tour is at most this long
+    :param seed: seed of the starts, start i uses seed + i
+    :param neighborhoods: neighborhoods of TSP2opt
+    :param max_iter: max_iter of each start
+    :return: best tour (list of edges), its length, and the stats of every start
+    """
+    import multiprocessing as mp
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from multiprocessing import shared_memory
+
+    d = np.ascontiguousarray(d)
+    deadline = None if time_limit is None else time.time() + time_limit
+    shm = shared_memory.SharedMemory(create=True, size=max(d.nbytes, 1))
+    try:
+        np.ndarray(d.shape, dtype=d.dtype, buffer=shm.buf)[:] = d
+        stop_event = mp.Event()
+        best_order, best_length, all_stats = None, np.inf, []
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker,
+                                 initargs=(shm.name, d.shape, d.dtype, stop_event)) as pool:
+            futures = [pool.submit(_solve_start, kinds[i % len(kinds)], seed + i, deadline,
+                                   target_length, neighborhoods, max_iter) for i in range(n_starts)]
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                order, stats = future.result()
+                all_stats.append(stats)
+                if order is not None and stats['length'] < best_length:
+                    best_order, best_length = order, stats['length']
+                if stop_event.is_set():
+                    for f in futures:
+                        f.cancel()
+    finally:
+        shm.close()
+        shm.unlink()
+    best_tour = None if best_order is None else list(zip(best_order, best_order[1:] + best_order[:1]))
+    return best_tour, best_length, all_stats
+
+
+def test_tsp2opt():
+    for _ in range(100):
+        n = np.random.randint(3, 30)
+        d = np.random.randint(1, 1000, (n, n))
+        for dist in (d, d + d.T):
+            for neighborhoods in ([TwoOpt()], [NodeInsertion()], [TwoOpt(), OrOpt()]):
+                tsp = TSP2opt(dist, neighborhoods)
+                tsp.solve()
+                assert sorted(u for u, _ in tsp.tour) == list(range(n))
+                assert tsp.tour_length == sum(dist[u][v] for (u, v) in tsp.tour)
+    # Progress callbacks, and the files of Trace.
+    import contextlib
+    import io
+    import os
+    import tempfile
+    d = np.random.randint(1, 1000, (40, 40))
+    d = d + d.T
+    trace = Trace(run=3)
+    tsp = TSP2opt(d)
+    tsp.callback = trace
+    start_length = tsp.tour_length
+    tsp.solve()
+    iterations = [r[1] for r in trace.records]
+    lengths = [r[2] for r in trace.records]
+    assert iterations == list(range(1, tsp._iter + 1)) and len(iterations) > 0
+    assert all(a > b for a, b in zip([start_length] + lengths, lengths)) and lengths[-1] == tsp.tour_length
+    assert all(r[0] == 3 and r[3] in ('2opt', 'or-opt') and r[4] >= 0 for r in trace.records)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        trace.to_json(os.path.join(tmpdir, 'trace.json'))
+        with open(os.path.join(tmpdir, 'trace.json')) as f:
+            rows = json.load(f)
+        assert [r['iteration'] for r in rows] == iterations and [r['length'] for r in rows] == lengths
+        assert all(list(r) == list(Trace.fields) for r in rows)
+        trace.to_csv(os.path.join(tmpdir, 'trace.csv'))
+        with open(os.path.join(tmpdir, 'trace.csv'), newline='') as f:
+            rows = list(csv.reader(f))
+        assert tuple(rows[0]) == Trace.fields
+        assert [int(r[1]) for r in rows[1:]] == iterations and [int(r[2]) for r in rows[1:]] == lengths
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        PrintProgress()(Progress(7, 123, '2opt', 0.5, 10.0))
+    assert out.getvalue() == ">> iter = 7, tour length = 123, move = 2opt\n"
+    print('[test_tsp2opt] Passed.')
+
+
+def test_multi_start():
+    import os
+    shm_before = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+    d = random_euclidean_instance(200)
+    tour, length, stats = multi_start(d, n_starts=4, n_workers=2)
+    order = [u for u, _ in tour]
+    assert sorted(order) == list(range(200)) and all(v == order[(i + 1) % 200] for i, (_, v) in enumerate(tour))
+    assert np.isclose(length, sum(float(d[u, v]) for u, v in tour), rtol=1e-4)
+    assert len(stats) == 4 and length == min(s['length'] for s in stats)
+    assert sorted(s['kind'] for s in stats) == ['greedy', 'nearest', 'random', 'random']
+    # Any tour reaches the target: the first start to finish stops the others, which are skipped.
+    tour, length, stats = multi_start(d, n_starts=16, n_workers=2, target_length=1e9)
+    assert sorted(u for u, _ in tour) == list(range(200)) and length <= 1e9
+    assert sum('length' in s for s in stats) <= 2
+    # The time limit stops the starts that run and skips the ones that have not begun.
+    start = time.time()
+    tour, length, stats = multi_start(d, n_starts=200, kinds=('random',), n_workers=2, time_limit=0.5)
+    assert time.time() - start < 10 and sum('length' in s for s in stats) < 200
+    assert tour is None or sorted(u for u, _ in tour) == list(range(200))
+    tour, length, stats = multi_start(d, n_starts=2, n_workers=2, time_limit=0)
+    assert tour is None and length == np.inf and not any('length' in s for s in stats)
+    # The shared memory is released.
+    if os.path.isdir('/dev/shm'):
+        assert set(os.listdir('/dev/shm')) <= shm_before
+    print('[test_multi_start] Passed.')
+
+
+def random_euclidean_instance(n, block=1024):
+    """ Distance matrix (float32) of n random points in the unit square. """
+    xy = np.random.rand(n, 2).astype(np.float32)
+    d = np.empty((n, n), dtype=np.float32)
+    for start in range(0, n, block):
+        diff = xy[start: start + block, None, :] - xy[None, :, :]
+        d[start: start + block] = np.sqrt((diff ** 2).sum(axis=2))
+    return d
+
+
+def benchmark(sizes=(100, 1000, 10000), max_iter=10**9):
+    """ Sweeps per second of TSP2opt.solve, where a sweep searches the candidate lists of n cities. """
+    for n in sizes:
+        d = random_euclidean_instance(n)
+        tsp = TSP2opt(d)
+        tsp.max_iter = max_iter
+        start_length = tsp.tour_length
+        start = time.perf_counter()
+        tsp.solve()
+        elapsed = time.perf_counter() - start
+        sweeps = tsp._scans / n
+        print(f"[benchmark] n = {n}: {sweeps / elapsed:.1f} sweeps/s, {tsp._iter} moves in {elapsed:.2f}s, "
+              f"length {start_length:.1f} -> {tsp.tour_length:.1f}")
+
+
 if __name__ == '__main__':
-    import numpy as np
     n = 100  # number of cities
     d = np.random.randint(1, 1000, (n, n))
     tsp = TSP2opt(d)
+    tsp.callback = PrintProgress()
     tsp.solve()
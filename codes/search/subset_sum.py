@@ -0,0 +1,147 @@
+import numpy as np
+
+
+# Largest number of items of meet in the middle: the two halves have 2^(n/2) subset sums.
+MITM_MAX_N = 50
+
+
+def _bit_positions(x, nbytes):
+    """ Positions of the set bits of the nonnegative integer x < 2^(8 nbytes). """
+    b = np.frombuffer(x.to_bytes(nbytes, 'little'), dtype=np.uint8)
+    nz = np.flatnonzero(b)
+    rows, cols = np.nonzero(np.unpackbits(b[nz, None], axis=1, bitorder='little'))
+    return nz[rows] * 8 + cols
+
+
+def subset_sum_bitset(numbers, targets):
+    """ Bitset DP: bit s of a big integer is set once s is the sum of a subset of the items seen,
+    and adding an item x is reach |= reach << x. The item that first reaches every sum is
+    recorded, which gives a witness by walking back from the target.
+    :param numbers: nonnegative integers
+    :param targets: targets, all answered by one pass over the items
+    :return: for every target, a subset (list of numbers) summing to it, or None
+    """
+    targets = list(targets)
+    T = max([t for t in targets if t >= 0], default=0)
+    nbytes = T // 8 + 1
+    mask = (1 << (T + 1)) - 1
+    first = np.full(T + 1, -1, dtype=np.int64)
+    reach = 1
+    for i, x in enumerate(numbers):
+        if x < 0:
+            raise ValueError("subset_sum_bitset: the numbers must be nonnegative.")
+        if x == 0 or x > T:
+            continue
+        new = (reach << x) & ~reach & mask
+        if new:
+            first[_bit_positions(new, nbytes)] = i
+            reach |= new
+    res = []
+    for t in targets:
+        if t < 0 or not (reach >> t) & 1:
+            res.append(None)
+            continue
+        subset = []
+        while t:
+            i = first[t]
+            subset.append(numbers[i])
+            t -= numbers[i]
+        res.append(subset[::-1])
+    return res
+
+
+def _subset_sums(numbers):
+    """ Sums of all the subsets of numbers, the subset of sums[mask] having the items of the bits of mask. """
+    sums = np.zeros(1, dtype=np.int64)
+    for x in numbers:
+        sums = np.concatenate((sums, sums + x))
+    return sums
+
+
+def subset_sum_mitm(numbers, targets):
+    """ Meet in the middle: the subset sums of the two halves of the items are enumerated and
+    sorted, and a target t is found as l + r by a merge join of the left sums with the sorted
+    right sums, looking up t - l for all l at once.
+    :param numbers: at most MITM_MAX_N integers (of any sign)
+    :param targets: targets, all answered against the same sorted sums
+    :return: for every target, a subset (list of numbers) summing to it, or None
+    """
+    numbers = list(numbers)
+    if len(numbers) > MITM_MAX_N:
+        raise ValueError(f"subset_sum_mitm: more than {MITM_MAX_N} numbers.")
+    h = len(numbers) // 2
+    left, right = _subset_sums(numbers[:h]), _subset_sums(numbers[h:])
+    order = np.argsort(right, kind='stable')
+    right = right[order]
+    res = []
+    for t in targets:
+        j = np.minimum(np.searchsorted(right, t - left), len(right) - 1)
+        hits = np.flatnonzero(right[j] == t - left)
+        if len(hits) == 0:
+            res.append(None)
+            continue
+        lmask, rmask = int(hits[0]), int(order[j[hits[0]]])
+        res.append([x for k, x in enumerate(numbers[:h]) if lmask >> k & 1] +
+                   [x for k, x in enumerate(numbers[h:]) if rmask >> k & 1])
+    return res
+
+
+def subset_sum(numbers, target, method=None):
+    """ Finds a subset of numbers summing to target.
+    :param numbers: integers
+    :param target: an integer, or a list of targets answered in one pass
+    :param method: 'bitset' (nonnegative numbers, time n * max target / 64),
+        'mitm' (at most MITM_MAX_N numbers, time 2^(n/2)), default is the cheaper one
+    :return: subset (list of numbers) summing to target or None, a list of them for a list of targets
+    """
+    numbers = list(numbers)
+    batch = np.ndim(target) > 0
+    targets = list(target) if batch else [target]
+    if not targets:
+        return []
+    if method is None:
+        n = len(numbers)
+        T = max(max(targets), 0)
+        nonnegative = all(x >= 0 for x in numbers)
+        if nonnegative and (n > MITM_MAX_N or n * T / 64 <= 2 ** (n / 2) * (len(targets) + n / 2)):
+            method = 'bitset'
+        else:
+            method = 'mitm'
+    engine = {'bitset': subset_sum_bitset, 'mitm': subset_sum_mitm}[method]
+    res = engine(numbers, targets)
+    return res if batch else res[0]
+
+
+def test_subset_sum():
+    from itertools import combinations
+    for _ in range(100):
+        n = np.random.randint(0, 12)
+        numbers = np.random.randint(0, 30, n).tolist()
+        sums = {sum(c) for k in range(n + 1) for c in combinations(numbers, k)}
+        targets = list(range(-2, sum(numbers) + 3))
+        for method in (None, 'bitset', 'mitm'):
+            for t, subset in zip(targets, subset_sum(numbers, targets, method)):
+                if t in sums:
+                    assert sum(subset) == t
+                    rest = list(numbers)
+                    for x in subset:
+                        rest.remove(x)
+                else:
+                    assert subset is None
+        negatives = np.random.randint(-20, 20, n).tolist()
+        sums = {sum(c) for k in range(n + 1) for c in combinations(negatives, k)}
+        for t in range(-60, 60):
+            subset = subset_sum(negatives, t)
+            assert (subset is None) == (t not in sums)
+            assert subset is None or sum(subset) == t
+    assert subset_sum([3, 5], []) == [] and subset_sum([3, 5], np.array([], dtype=int), 'mitm') == []
+    numbers = np.random.randint(10**9, 10**10, 40).tolist()
+    t = sum(numbers[::3])
+    assert sum(subset_sum(numbers, t)) == t
+    print('[test_subset_sum] Passed.')
+
+
+if __name__ == "__main__":
+    numbers = [3, 8, 10, 6, 7]
+    print(subset_sum(numbers, 15))
+    print(subset_sum(numbers, [15, 2, 34]))